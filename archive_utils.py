@@ -0,0 +1,404 @@
+import hashlib
+import io
+import json
+import os
+import posixpath
+import shutil
+import stat
+import sys
+import tarfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from build_config_utils import BuildConfig
+from constants import CONFIG_FILE
+from debug_utils import error
+from exclude_matcher import ExcludeMatcher
+from file_utils import remove_excluded_paths
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# chunk size for copying members out of the stream, bounds the memory an install uses
+COPY_CHUNK = 1024 * 1024
+
+
+class UnsafeArchiveError(Exception):
+    pass
+
+
+@dataclass
+class ExtractStats:
+    files: int = 0
+    bytes: int = 0
+    skipped: int = 0
+    # written before the config was seen, checked against the excludes afterwards
+    pending: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return f"extracted {self.files} files ({self.bytes} bytes), skipped {self.skipped} excluded"
+
+
+def open_archive(source: str):
+    """
+    Opens source, a path or - for stdin, as a binary stream of tar data. gzip, xz and bzip2
+    are left to tarfile, zstd needs the optional zstandard package.
+    """
+    stream = sys.stdin.buffer if source == "-" else open(source, "rb")
+    if stream.peek(4)[:4] != ZSTD_MAGIC:
+        return stream
+
+    try:
+        import zstandard
+    except ImportError:
+        error("reading .tar.zst archives needs the zstandard package, pip install zstandard")
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+def _safe_path(name: str) -> str:
+    """
+    name relative to the archive root, refusing anything that would land outside it.
+    """
+    if posixpath.isabs(name):
+        raise UnsafeArchiveError(f"absolute path in archive: {name}")
+    rel = posixpath.normpath(name)
+    if rel == ".." or rel.startswith("../"):
+        raise UnsafeArchiveError(f"path escapes the archive: {name}")
+    return "" if rel == "." else rel
+
+
+def _link_target(member: tarfile.TarInfo, rel: str) -> str:
+    """
+    Where a link member points, relative to the archive root.
+    Symlinks are relative to their directory, hardlinks name another member.
+    """
+    if member.issym():
+        if posixpath.isabs(member.linkname):
+            raise UnsafeArchiveError(f"absolute link in archive: {rel} -> {member.linkname}")
+        return _safe_path(posixpath.join(posixpath.dirname(rel), member.linkname))
+    return _safe_path(member.linkname)
+
+
+def _inside(root: str, path: str) -> bool:
+    return path == root or path.startswith(root + os.sep)
+
+
+def _landing_path(root: str, rel: str, member: tarfile.TarInfo) -> Path:
+    """
+    Where member lands under root, the real path of the destination. _safe_path only sees
+    the name as text, a symlink written earlier in the same archive can still take a
+    member, or what a link member points to, out of root, so both are resolved on disk.
+    """
+    parent = os.path.realpath(os.path.join(root, posixpath.dirname(rel)))
+    if not _inside(root, parent):
+        raise UnsafeArchiveError(f"path escapes the archive through a symlink: {rel}")
+    if member.issym():
+        points_to = os.path.realpath(os.path.join(parent, member.linkname))
+    elif member.islnk():
+        points_to = os.path.realpath(os.path.join(root, member.linkname))
+    else:
+        points_to = parent
+    if not _inside(root, points_to):
+        raise UnsafeArchiveError(f"link escapes the archive through a symlink: {rel}")
+    return Path(parent, posixpath.basename(rel))
+
+
+def _config_prefix(rel: str) -> str | None:
+    """
+    The project root an entry at rel would be the config of: the archive root,
+    or the single top level directory release tarballs usually wrap everything in.
+    """
+    if rel == CONFIG_FILE:
+        return ""
+    top, _, rest = rel.partition("/")
+    if rest == CONFIG_FILE:
+        return top + "/"
+    return None
+
+
+class _Extractor:
+    def __init__(self, dest: Path):
+        self.dest = dest
+        self.root = os.path.realpath(dest)
+        self.stats = ExtractStats()
+        self.prefix: str | None = None
+        self.build: BuildConfig | None = None
+        self.matcher: ExcludeMatcher | None = None
+        # directory modes are set at the end, a read only directory would stop its own extraction
+        self.dir_modes: dict[str, int] = {}
+
+    def extract(self, tar: tarfile.TarFile) -> None:
+        for member in tar:
+            rel = _safe_path(member.name)
+            if not rel:
+                continue
+            if member.issym() or member.islnk():
+                target = _link_target(member, rel)
+                # links must stay inside the project, it is all that ends up installed
+                if self.prefix and self._project_rel(target) is None:
+                    raise UnsafeArchiveError(f"link points outside the project: {rel}")
+
+            if self.build is None and member.isfile() and _config_prefix(rel) is not None:
+                self._write(tar, member, rel)
+                self._load_config(rel)
+                if self.matcher.excludes(CONFIG_FILE):
+                    (self.dest / rel).unlink()
+                continue
+
+            if self.prefix is not None:
+                project_rel = self._project_rel(rel)
+                if project_rel is None:
+                    self.stats.skipped += 1
+                    continue
+                if project_rel and self.matcher.excludes(project_rel, member.isdir()):
+                    self.stats.skipped += 1
+                    continue
+            else:
+                self.stats.pending.append(rel)
+
+            self._write(tar, member, rel)
+
+    def _project_rel(self, rel: str) -> str | None:
+        """rel relative to the project root, "" for the root itself, None if it's outside."""
+        if not self.prefix:
+            return rel
+        if rel + "/" == self.prefix:
+            return ""
+        return rel[len(self.prefix):] if rel.startswith(self.prefix) else None
+
+    def _load_config(self, rel: str) -> None:
+        # a member can only be read once from a stream, so the config is read back from disk
+        self.build = BuildConfig(text=(self.dest / rel).read_text(encoding="utf-8"))
+        self.prefix = _config_prefix(rel)
+        self.matcher = ExcludeMatcher(self.build.get_remote_excluded_files())
+
+    def _write(self, tar: tarfile.TarFile, member: tarfile.TarInfo, rel: str) -> None:
+        target = _landing_path(self.root, rel, member)
+        if os.path.lexists(target) and (target.is_symlink() or not target.is_dir()):
+            # the same path twice in one archive, the last one wins like with tar
+            target.unlink()
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if member.isdir():
+            target.mkdir(exist_ok=True)
+            self.dir_modes[rel] = member.mode & 0o777
+        elif member.issym():
+            os.symlink(member.linkname, target)
+        elif member.islnk():
+            source = Path(self.root, _link_target(member, rel))
+            if not source.exists():
+                # links to an excluded file, its content went by without being written
+                self.stats.skipped += 1
+                return
+            os.link(source, target)
+        elif member.isfile():
+            source = tar.extractfile(member)
+            with open(target, "xb") as f:
+                shutil.copyfileobj(source, f, COPY_CHUNK)
+            # setuid and friends are dropped, like tar --no-same-permissions
+            os.chmod(target, member.mode & 0o777)
+            os.utime(target, (member.mtime, member.mtime))
+            self.stats.files += 1
+            self.stats.bytes += member.size
+        else:
+            # devices and fifos have no place in an install
+            self.stats.skipped += 1
+
+    def finish(self) -> Path:
+        """
+        Applies the excludes to what was written before the config was found
+        and returns the project root inside dest.
+        """
+        if self.build is None:
+            raise UnsafeArchiveError(f"no {CONFIG_FILE} in the archive")
+
+        inside = []
+        outside = set()
+        for rel in self.stats.pending:
+            project_rel = self._project_rel(rel)
+            if project_rel is None:
+                outside.add(rel.split("/")[0])
+            elif project_rel:
+                inside.append(project_rel)
+        for top in outside:
+            if os.path.lexists(self.dest / top):
+                _remove_tree(self.dest / top)
+        root = self.dest / self.prefix if self.prefix else self.dest
+        self.stats.skipped += remove_excluded_paths(root, inside, self.matcher)
+
+        for rel, mode in sorted(self.dir_modes.items(), reverse=True):
+            if os.path.isdir(self.dest / rel):
+                os.chmod(self.dest / rel, mode | 0o700)
+        return root
+
+
+def _remove_tree(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+
+
+def extract_archive(source: str, dest: Path) -> tuple[Path, BuildConfig, ExtractStats]:
+    """
+    Unpacks the tar archive at source, or stdin for -, into dest in one streaming pass.
+    Files excluded by the dumb_build.toml found in the archive are never written, apart
+    from ones that come before it in the stream, which are removed at the end.
+    Returns the project root, which is dest or the archive's top level directory in it.
+    """
+    stream = open_archive(source)
+    try:
+        with tarfile.open(fileobj=stream, mode="r|*") as tar:
+            extractor = _Extractor(dest)
+            extractor.extract(tar)
+        return extractor.finish(), extractor.build, extractor.stats
+    finally:
+        if source != "-":
+            stream.close()
+
+
+# a bundle is a tar archive whose first member is a json header holding the resolved
+# config, the metadata and the manifest of an install, followed by the install's files
+BUNDLE_HEADER = ".dumb_bundle.json"
+BUNDLE_VERSION = 1
+
+
+class BundleError(Exception):
+    pass
+
+
+def _bundle_mode(path: str) -> str:
+    if path == "-" or path.endswith((".tar.gz", ".tgz")):
+        return "w|gz"
+    if path.endswith(".tar.xz"):
+        return "w|xz"
+    if path.endswith(".tar"):
+        return "w|"
+    raise BundleError(f"unknown bundle format {path}, use .tar, .tar.gz or .tar.xz")
+
+
+def _normalize(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    # owners don't mean anything on the nodes a bundle is imported on
+    info.uid = info.gid = 0
+    info.uname = info.gname = "root"
+    return info
+
+
+def export_bundle(header: dict, install_dir: Path, manifest, out: str) -> ExtractStats:
+    """
+    Writes the files in manifest from install_dir to out, - for stdout, after a header
+    built from header and the manifest. The manifest's hashes are what import_bundle
+    checks the files against, so it has to describe install_dir as it is now.
+    """
+    header = dict(header, version=BUNDLE_VERSION, manifest=manifest.files,
+                  exclude=manifest.exclude)
+    header_data = json.dumps(header).encode("utf-8")
+    stats = ExtractStats()
+    mode = _bundle_mode(out)
+
+    stream = sys.stdout.buffer if out == "-" else open(out, "wb")
+    try:
+        with tarfile.open(fileobj=stream, mode=mode) as tar:
+            info = _normalize(tarfile.TarInfo(BUNDLE_HEADER))
+            info.size = len(header_data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(header_data))
+
+            for rel in sorted(manifest.files):
+                # hardlinks, like deduplicated files, are stored once and linked to after that
+                tar.add(install_dir / rel, arcname=rel, recursive=False, filter=_normalize)
+                stats.files += 1
+                stats.bytes += manifest.files[rel][0]
+    except BaseException:
+        if out != "-":
+            stream.close()
+            os.unlink(out)
+        raise
+    if out != "-":
+        stream.close()
+    return stats
+
+
+class _BundleReader:
+    def __init__(self, dest: Path, header: dict):
+        self.dest = dest
+        self.root = os.path.realpath(dest)
+        self.header = header
+        self.files: dict[str, list] = header["manifest"]
+        self.digests: dict[str, str] = {}
+        self.stats = ExtractStats()
+
+    def extract(self, tar: tarfile.TarFile) -> None:
+        # iterating the tarfile would start over at the header, next() carries on after it
+        while (member := tar.next()) is not None:
+            rel = _safe_path(member.name)
+            record = self.files.get(rel)
+            if record is None or rel in self.digests:
+                raise BundleError(f"{rel} isn't in the bundle's manifest")
+            if member.issym() or member.islnk():
+                _link_target(member, rel)
+
+            # the manifest comes with the bundle, it can't vouch for where a path lands
+            target = _landing_path(self.root, rel, member)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if member.issym():
+                os.symlink(member.linkname, target)
+                digest = "link:" + member.linkname
+            elif member.islnk():
+                source = _safe_path(member.linkname)
+                if source not in self.digests:
+                    raise BundleError(f"{rel} links to {source} which comes later or not at all")
+                os.link(Path(self.root, source), target)
+                digest = self.digests[source]
+            elif member.isfile():
+                digest = self._write_file(tar, member, target)
+            else:
+                raise BundleError(f"{rel} isn't a file, directory or link")
+
+            if digest != record[3]:
+                raise BundleError(f"{rel} doesn't match its hash in the manifest")
+            self.digests[rel] = digest
+            self.stats.files += 1
+
+            if not member.islnk():
+                # the manifest's stat lets the install reuse its hashes instead of reading files
+                if not member.issym():
+                    os.chmod(target, stat.S_IMODE(record[2]) & 0o777)
+                os.utime(target, ns=(record[1], record[1]), follow_symlinks=False)
+
+        missing = len(self.files) - len(self.digests)
+        if missing:
+            raise BundleError(f"{missing} files in the manifest are missing from the bundle")
+
+    def _write_file(self, tar: tarfile.TarFile, member: tarfile.TarInfo, target: Path) -> str:
+        source = tar.extractfile(member)
+        digest = hashlib.sha256()
+        with open(target, "xb") as f:
+            while chunk := source.read(COPY_CHUNK):
+                digest.update(chunk)
+                f.write(chunk)
+        self.stats.bytes += member.size
+        return digest.hexdigest()
+
+
+def import_bundle(source: str, dest: Path) -> tuple[dict, ExtractStats]:
+    """
+    Unpacks a bundle from export_bundle into dest in one streaming pass, hashing every
+    file as it is written and checking it against the manifest in the header.
+    Raises BundleError on anything the manifest doesn't account for.
+    Returns the header.
+    """
+    stream = open_archive(source)
+    try:
+        with tarfile.open(fileobj=stream, mode="r|*") as tar:
+            first = tar.next()
+            if first is None or first.name != BUNDLE_HEADER:
+                raise BundleError(f"not a din bundle, {BUNDLE_HEADER} has to come first")
+            header = json.loads(tar.extractfile(first).read())
+            if header.get("version") != BUNDLE_VERSION:
+                raise BundleError(f"unsupported bundle version {header.get('version')}")
+
+            reader = _BundleReader(dest, header)
+            reader.extract(tar)
+        return header, reader.stats
+    finally:
+        if source != "-":
+            stream.close()
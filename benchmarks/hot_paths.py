@@ -0,0 +1,264 @@
+"""
+Times din's install, update and uninstall paths on generated projects.
+
+    python benchmarks/hot_paths.py --repeat 5 --output results.json
+    python benchmarks/hot_paths.py --scale 0.1 --project deep
+
+Every project is generated from a fixed seed, so two runs on different commits
+time the same trees. Each project is installed from its directory and from a
+local bare git repo, din runs as a subprocess with DUMB_INSTALL_ROOT and
+DUMB_BIN_DIR pointing into a temp directory, so nothing outside of it is
+touched. The file_utils functions behind those commands are also timed
+in-process. Results are printed as JSON, the median of --repeat runs per step.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from exclude_matcher import ExcludeMatcher  # noqa: E402
+from file_utils import copy_project, directories_differ, remove_excluded  # noqa: E402
+from manifest import Manifest  # noqa: E402
+
+DIN = REPO / "dumb_installer.py"
+SEED = 1234
+GIT = ["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost",
+       "-c", "init.defaultBranch=main"]
+
+
+def write_file(path: Path, size: int, rng: random.Random) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(rng.randbytes(size))
+
+
+def small_files(root: Path, rng: random.Random, scale: float) -> list[str]:
+    """Many small files spread over a few flat directories."""
+    for i in range(int(3000 * scale)):
+        write_file(root / f"pkg{i % 30}" / f"module_{i}.py", rng.randint(200, 2000), rng)
+    return ["*.pyc", "__pycache__"]
+
+
+def deep(root: Path, rng: random.Random, scale: float) -> list[str]:
+    """A few files on every level of deeply nested directories."""
+    for branch in range(max(1, int(10 * scale))):
+        level = root / f"branch{branch}"
+        for depth in range(40):
+            level = level / f"d{depth}"
+            for i in range(5):
+                write_file(level / f"f{i}.txt", rng.randint(100, 1000), rng)
+    return ["*.pyc", "__pycache__"]
+
+
+def large_binaries(root: Path, rng: random.Random, scale: float) -> list[str]:
+    """A handful of large files next to a small amount of source."""
+    for i in range(4):
+        write_file(root / "assets" / f"blob{i}.bin", int(32 * 1024 * 1024 * scale), rng)
+    for i in range(20):
+        write_file(root / "src" / f"module_{i}.py", rng.randint(200, 2000), rng)
+    return ["*.pyc", "__pycache__"]
+
+
+def heavy_excludes(root: Path, rng: random.Random, scale: float) -> list[str]:
+    """Half of the tree is excluded by a long list of patterns of every kind."""
+    count = int(1500 * scale)
+    for i in range(count):
+        write_file(root / "src" / f"pkg{i % 20}" / f"module_{i}.py", rng.randint(200, 2000), rng)
+        write_file(root / "build" / f"pkg{i % 20}" / f"module_{i}.o", rng.randint(200, 2000), rng)
+        if i % 3 == 0:
+            write_file(root / "src" / f"pkg{i % 20}" / f"module_{i}.log", 100, rng)
+    patterns = ["/build/", "*.log", "**/*.tmp", "node_modules/", "!src/pkg0/keep.log"]
+    patterns += [f"src/pkg{i % 20}/generated_{i}_*.py" for i in range(300)]
+    return patterns
+
+
+PROJECTS = {
+    "small_files": small_files,
+    "deep": deep,
+    "large_binaries": large_binaries,
+    "heavy_excludes": heavy_excludes,
+}
+
+
+def generate(kind: str, root: Path, scale: float) -> list[str]:
+    rng = random.Random(f"{SEED}-{kind}")
+    root.mkdir(parents=True)
+    excluded = PROJECTS[kind](root, rng, scale)
+    (root / "main.txt").write_text("hello\n")
+    (root / "dumb_build.toml").write_text(
+        "[build]\n"
+        f'executable_name = "bench_{kind}"\n'
+        'command = "cat $dumb_project_dir/main.txt"\n'
+        f"excluded = {json.dumps(excluded)}\n"
+        'local_install_excluded = [".git"]\n'
+    )
+    return excluded
+
+
+def git(*args, cwd: Path) -> None:
+    subprocess.run([*GIT, *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_git_source(project: Path, bare: Path) -> Path:
+    """Commits the project into a work tree pushed to a bare repo, returns the work tree."""
+    work = project.with_name(project.name + "_work")
+    shutil.copytree(project, work)
+    git("init", "-q", cwd=work)
+    git("add", "-A", cwd=work)
+    git("commit", "-q", "-m", "initial", cwd=work)
+    git("init", "-q", "--bare", str(bare), cwd=work)
+    git("push", "-q", str(bare), "HEAD:main", cwd=work)
+    return work
+
+
+class Din:
+    def __init__(self, install_root: Path, bin_dir: Path):
+        self.env = dict(os.environ, DUMB_INSTALL_ROOT=str(install_root), DUMB_BIN_DIR=str(bin_dir))
+
+    def __call__(self, *args, cwd: Path) -> float:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, str(DIN), *args], cwd=cwd, env=self.env,
+                                capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"din {' '.join(args)} failed:\n{result.stdout}{result.stderr}")
+        return elapsed
+
+
+def change_one_file(work: Path, run: int, is_git: bool, bare: Path) -> None:
+    (work / "main.txt").write_text(f"hello {run}\n")
+    if is_git:
+        git("commit", "-q", "-am", f"change {run}", cwd=work)
+        git("push", "-q", str(bare), "HEAD:main", cwd=work)
+
+
+def bench_cli(kind: str, source: str, project: Path, tmp: Path, din: Din,
+              repeat: int) -> dict[str, list[float]]:
+    name = f"bench_{kind}"
+    timings = {"install": [], "noop_update": [], "one_file_update": [], "uninstall": []}
+    is_git = source == "git"
+    bare = tmp / f"{kind}.git"
+    work = make_git_source(project, bare) if is_git else project
+    install_args = [f"file://{bare}"] if is_git else []
+
+    for run in range(repeat):
+        timings["install"].append(din(*install_args, cwd=work))
+        timings["noop_update"].append(din("--update", name, cwd=work))
+        change_one_file(work, run, is_git, bare)
+        timings["one_file_update"].append(din("--update", name, cwd=work))
+        timings["uninstall"].append(din("-E", name, cwd=work))
+    return timings
+
+
+def bench_update_all(projects: dict[str, Path], din: Din, repeat: int) -> list[float]:
+    for project in projects.values():
+        din(cwd=project)
+    timings = [din("--update-all", cwd=REPO) for _ in range(repeat)]
+    for kind, project in projects.items():
+        din("-E", f"bench_{kind}", cwd=project)
+    return timings
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def bench_functions(project: Path, excluded: list[str], tmp: Path,
+                    repeat: int) -> dict[str, list[float]]:
+    """Times the file_utils functions the commands are built on, without din's startup."""
+    matcher = ExcludeMatcher(excluded)
+    timings = {"copy_project": [], "directories_differ": [], "manifest_build": [],
+               "remove_excluded": []}
+    for run in range(repeat):
+        copy = tmp / f"copy_{run}"
+        timings["copy_project"].append(timed(copy_project, project, copy, matcher))
+        timings["directories_differ"].append(timed(directories_differ, project, copy, excluded))
+        timings["manifest_build"].append(timed(Manifest.build, project, matcher))
+        full = tmp / f"full_{run}"
+        shutil.copytree(project, full)
+        timings["remove_excluded"].append(timed(remove_excluded, full, matcher))
+        shutil.rmtree(copy)
+        shutil.rmtree(full)
+    return timings
+
+
+def repo_revision() -> str | None:
+    result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def summarize(timings: list[float]) -> dict[str, float]:
+    return {"median": round(statistics.median(timings), 4),
+            "min": round(min(timings), 4), "max": round(max(timings), 4)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark din's hot paths")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiplies the file counts and sizes of every project")
+    parser.add_argument("--project", action="append", choices=PROJECTS,
+                        help="only run these projects, can be repeated")
+    parser.add_argument("--source", action="append", choices=["local", "git"],
+                        help="only install from these sources, can be repeated")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    kinds = args.project or list(PROJECTS)
+    sources = args.source or ["local", "git"]
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="din_bench_") as tmp_name:
+        tmp = Path(tmp_name)
+        din = Din(tmp / "install_root", tmp / "bin")
+        projects = {}
+        for kind in kinds:
+            project = tmp / "projects" / kind
+            excluded = generate(kind, project, args.scale)
+            projects[kind] = project
+            print(f"benchmarking {kind}", file=sys.stderr)
+
+            for name, timings in bench_functions(project, excluded, tmp, args.repeat).items():
+                results.append({"project": kind, "source": "function", "step": name,
+                                **summarize(timings)})
+            for source in sources:
+                pristine = tmp / f"{kind}_{source}"
+                shutil.copytree(project, pristine)
+                for step, timings in bench_cli(kind, source, pristine, tmp, din,
+                                               args.repeat).items():
+                    results.append({"project": kind, "source": source, "step": step,
+                                    **summarize(timings)})
+
+        if "local" in sources:
+            results.append({"project": "all", "source": "local", "step": "update_all",
+                            **summarize(bench_update_all(projects, din, args.repeat))})
+
+    output = json.dumps({
+        "revision": repo_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "results": results,
+    }, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Checks din's own startup cost per command against benchmarks/startup_budget.json.
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --report=-E   # -X importtime report for one command
+    python benchmarks/startup.py --write-budget
+
+For every command in the budget file din is started with python -X importtime,
+the modules it imports on top of a bare interpreter are counted and the median
+wall clock time of the runs is taken. Exits 1 if any command imports more
+modules or takes longer than its budget. Only read only commands are measured,
+none of them touch an install.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+DIN = REPO / "dumb_installer.py"
+BUDGET_FILE = Path(__file__).resolve().parent / "startup_budget.json"
+
+COMMANDS = {
+    "--help": ["--help"],
+    "-E": ["-E", "din-startup-benchmark-missing"],
+    "--list": ["--list"],
+    "--status": ["--status", "din-startup-benchmark-missing"],
+}
+# headroom --write-budget leaves on top of the measured numbers
+MODULE_HEADROOM = 5
+TIME_HEADROOM = 1.5
+
+
+def imported_modules(args: list[str]) -> list[tuple[str, int]]:
+    """Returns (module, cumulative microseconds) for every import, in import order."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args],
+                            capture_output=True, text=True, cwd=REPO)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def wall_ms(args: list[str], runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=REPO,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def measure(runs: int) -> dict[str, dict[str, float]]:
+    baseline = {name for name, _ in imported_modules(["-c", "pass"])}
+    baseline_ms = wall_ms(["-c", "pass"], runs)
+    results = {}
+    for command, args in COMMANDS.items():
+        modules = [name for name, _ in imported_modules([str(DIN), *args])]
+        results[command] = {
+            "modules": len([name for name in modules if name not in baseline]),
+            "ms": round(wall_ms([str(DIN), *args], runs) - baseline_ms, 2),
+        }
+    return results
+
+
+def report(command: str) -> None:
+    """Prints the slowest top level imports of one command, like sorting -X importtime output."""
+    modules = imported_modules([str(DIN), *COMMANDS[command]])
+    for name, cumulative in sorted(modules, key=lambda m: m[1], reverse=True)[:25]:
+        print(f"{cumulative / 1000:>8.2f} ms  {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="check din's startup budget")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--report", choices=COMMANDS, default=None,
+                        help="print the slowest imports of one command instead")
+    parser.add_argument("--write-budget", action="store_true",
+                        help="write the current numbers plus headroom as the new budget")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.report)
+        return
+
+    results = measure(args.runs)
+    if args.write_budget:
+        budget = {command: {"modules": r["modules"] + MODULE_HEADROOM,
+                            "ms": round(max(r["ms"], 1) * TIME_HEADROOM, 1)}
+                  for command, r in results.items()}
+        BUDGET_FILE.write_text(json.dumps(budget, indent=2) + "\n")
+        print(f"wrote {BUDGET_FILE}")
+        return
+
+    budget = json.loads(BUDGET_FILE.read_text())
+    over = False
+    print(f"{'command':<12}{'modules':>9}{'budget':>8}{'ms':>9}{'budget':>9}")
+    for command, r in results.items():
+        limit = budget[command]
+        failed = r["modules"] > limit["modules"] or r["ms"] > limit["ms"]
+        over |= failed
+        print(f"{command:<12}{r['modules']:>9}{limit['modules']:>8}{r['ms']:>9.2f}"
+              f"{limit['ms']:>9.1f}{'  over budget' if failed else ''}")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares per-invocation latency of the wrapper modes.
+
+    python benchmarks/wrapper_latency.py --runs 200
+
+Builds a throwaway project and bin dir in a temp directory, writes one wrapper
+per mode for the same command and times running each of them.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from constants import WRAPPER_MODES  # noqa: E402
+from wrapper_utils import write_wrapper  # noqa: E402
+
+
+def time_runs(executable: Path, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([str(executable), "arg"], check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="benchmark wrapper modes")
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        project_dir = Path(tmp) / "project"
+        bin_dir = Path(tmp) / "bin"
+        project_dir.mkdir()
+        (project_dir / "main.py").write_text("import sys\nprint(sys.argv[1:])\n")
+        command = "python3 $dumb_project_dir/main.py"
+
+        print(f"{'mode':<28}{'mean ms':>10}{'median ms':>12}{'p95 ms':>10}")
+        for mode in WRAPPER_MODES:
+            name = f"bench_{mode}"
+            used = write_wrapper(name, command, project_dir, bin_dir, mode)
+            timings = sorted(time_runs(bin_dir / name, args.runs))
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{used:<28}{statistics.mean(timings) * 1000:>10.2f}"
+                  f"{statistics.median(timings) * 1000:>12.2f}{p95 * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from debug_utils import error
 from pathlib import Path
-from constants import CONFIG_FILE
+from constants import CONFIG_FILE, WRAPPER_MODES, WRAPPER_SHELL
 from typing import Self
-from collection_utils import merge_collections_to_set
+from collection_utils import merge_collections_ordered
+from exclude_matcher import ExcludeMatcher
 import tomllib
 
 
@@ -29,35 +30,77 @@ def _load_config(project_root: Path) -> dict:
     if not config_path.exists():
         error(f"{CONFIG_FILE} not found in current directory")
 
+    return _parse_config(config_path.read_text(encoding="utf-8"))
+
+
+def _parse_config(text: str) -> dict:
     try:
-        with config_path.open("rb") as f:
-            data = tomllib.load(f)
+        data = tomllib.loads(text)
     except Exception as e:
         error(f"failed to parse {CONFIG_FILE}: {e}")
 
     if "build" not in data:
         error("missing [build] section in dumb_build.toml")
 
-    build = data["build"]
+    return _check_build(data["build"])
+
 
+def _check_build(build: dict) -> dict:
     if "executable_name" not in build:
         error("missing 'executable_name' in [build]")
 
     if "command" not in build:
         error("missing 'command' in [build]")
 
+    if build.get("wrapper", WRAPPER_SHELL) not in WRAPPER_MODES:
+        error(f"'wrapper' in [build] must be one of {', '.join(WRAPPER_MODES)}")
+
     return build
 
 
 class BuildConfig:
 
-    def __init__(self, path: Path):
-        config = _load_config(path)
+    def __init__(self, path: Path = None, text: str = None, resolved: dict = None):
+        """
+        Loads CONFIG_FILE from the project at path, or parses text when the config
+        was read some other way, like from a git object before checking anything out.
+        resolved takes the output of resolved(), like the copy stored in a bundle.
+        """
+        if resolved is not None:
+            config = _check_build(resolved)
+        elif text is not None:
+            config = _parse_config(text)
+        else:
+            config = _load_config(path)
         self._excluded = _get_excluded(config)
         self._remote_excluded = _get_remote_excluded(config)
         self._local_excluded = _get_local_exclude(config)
         self.executable_name = config["executable_name"]
         self.command = config["command"]
+        self.wrapper = config.get("wrapper", WRAPPER_SHELL)
+        self.precompile = bool(config.get("precompile", False))
+        # a requirements or lock file in the project gets the install its own venv,
+        # filled from wheelhouse without touching an index when one is given
+        self.requirements = config.get("requirements")
+        self.wheelhouse = config.get("wheelhouse")
+        self.python = config.get("python", "python3")
+
+    def resolved(self) -> dict:
+        """
+        The [build] section with every default filled in.
+        """
+        return {
+            "executable_name": self.executable_name,
+            "command": self.command,
+            "wrapper": self.wrapper,
+            "precompile": self.precompile,
+            "requirements": self.requirements,
+            "wheelhouse": self.wheelhouse,
+            "python": self.python,
+            "excluded": list(self._excluded),
+            "remote_install_excluded": list(self._remote_excluded),
+            "local_install_excluded": list(self._local_excluded),
+        }
 
     @staticmethod
     def safe_get_build_config(path: Path) -> Self | None:
@@ -67,16 +110,33 @@ class BuildConfig:
         except BaseException:
             return None
 
+    # order is kept since a negated pattern only overrides the patterns before it
     def get_local_excluded_files(self) -> list[str]:
-        merged_set = merge_collections_to_set(
-            self._excluded, self._local_excluded)
-
-        return list(merged_set)
+        return merge_collections_ordered(self._excluded, self._local_excluded)
 
     def get_remote_excluded_files(self) -> list[str]:
-        merged_set = merge_collections_to_set(
-            self._excluded, self._remote_excluded)
-        return list(merged_set)
+        return merge_collections_ordered(self._excluded, self._remote_excluded)
+
+    def _generated_patterns(self) -> list[str]:
+        # compiled bytecode is generated at install time, syncing must leave it alone
+        return ["__pycache__"] if self.precompile else []
+
+    def get_generated_matcher(self) -> ExcludeMatcher:
+        """
+        Matches what din generates inside an install, which cleanups must keep.
+        """
+        return ExcludeMatcher(self._generated_patterns())
+
+    def get_local_exclude_matcher(self, *extra: str) -> ExcludeMatcher:
+        """
+        Compiles the local exclude patterns, plus extra, once for every walker to share.
+        """
+        return ExcludeMatcher(
+            self.get_local_excluded_files() + self._generated_patterns() + list(extra))
+
+    def get_remote_exclude_matcher(self, *extra: str) -> ExcludeMatcher:
+        return ExcludeMatcher(
+            self.get_remote_excluded_files() + self._generated_patterns() + list(extra))
 
 
 def safe_get_build_config(path) -> BuildConfig | None:
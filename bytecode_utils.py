@@ -0,0 +1,111 @@
+import importlib.util
+import multiprocessing
+import os
+import py_compile
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from exclude_matcher import ExcludeMatcher
+from manifest import walk_files
+
+
+@dataclass
+class CompileStats:
+    compiled: int = 0
+    up_to_date: int = 0
+    failed: int = 0
+
+    def summary(self) -> str:
+        return (f"compiled {self.compiled} files, {self.up_to_date} already up to date, "
+                f"{self.failed} failed")
+
+
+def _pyc_is_current(source: str, st: os.stat_result) -> bool:
+    """
+    Checks the timestamp based pyc header against the source, the way the import system does.
+    """
+    try:
+        with open(importlib.util.cache_from_source(source), "rb") as f:
+            header = f.read(16)
+    except OSError:
+        return False
+
+    if len(header) != 16 or header[:4] != importlib.util.MAGIC_NUMBER:
+        return False
+    if int.from_bytes(header[4:8], "little") != 0:
+        # hash based pycs are left to py_compile
+        return False
+    mtime = int.from_bytes(header[8:12], "little")
+    size = int.from_bytes(header[12:16], "little")
+    return mtime == (int(st.st_mtime) & 0xFFFFFFFF) and size == (st.st_size & 0xFFFFFFFF)
+
+
+def _compile(job: tuple[str, str]) -> bool:
+    source, display_path = job
+    try:
+        py_compile.compile(source, dfile=display_path, doraise=True)
+        return True
+    except (py_compile.PyCompileError, OSError):
+        return False
+
+
+def _python_sources(root: Path, exclude, paths):
+    """
+    Yields (rel_path, path, stat) for the python files under root, or only for those
+    in paths or under the directories in paths.
+    """
+    if paths is None:
+        yield from _python_sources_under(root, exclude, "")
+        return
+
+    matcher = ExcludeMatcher.of(exclude)
+    for start in paths:
+        path = os.path.join(root, start)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            continue
+        is_dir = stat.S_ISDIR(st.st_mode)
+        if matcher and matcher.excludes(start, is_dir):
+            continue
+        if is_dir:
+            yield from _python_sources_under(root, matcher, start)
+        elif start.endswith(".py") and stat.S_ISREG(st.st_mode):
+            yield start, path, st
+
+
+def _python_sources_under(root: Path, matcher, start: str):
+    for rel_path, entry in walk_files(root, matcher, start):
+        if rel_path.endswith(".py") and entry.is_file(follow_symlinks=False):
+            yield rel_path, entry.path, entry.stat()
+
+
+def precompile(root: Path, display_root: Path, exclude, workers: int = None,
+               paths: list[str] = None) -> CompileStats:
+    """
+    Compiles the python sources under root to __pycache__ across all cores.
+    Sources whose pyc is still current are skipped, so updates only recompile what changed.
+    Tracebacks show paths under display_root, the install's stable path, rather than root.
+    paths limits the work to those paths relative to root, for callers that know what changed.
+    """
+    stats = CompileStats()
+    jobs = []
+    for rel_path, path, st in _python_sources(root, exclude, paths):
+        if _pyc_is_current(path, st):
+            stats.up_to_date += 1
+        else:
+            jobs.append((path, str(display_root / rel_path)))
+
+    if len(jobs) > 1:
+        # update_all calls this from several threads at once, forking a threaded process can
+        # copy locks another thread holds into the workers, the forkserver is forked only once
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 mp_context=multiprocessing.get_context("forkserver")) as pool:
+            results = list(pool.map(_compile, jobs, chunksize=16))
+    else:
+        results = [_compile(job) for job in jobs]
+
+    stats.compiled = sum(results)
+    stats.failed = len(results) - stats.compiled
+    return stats
@@ -5,6 +5,16 @@ def merge_collections_to_set(*args) -> set:
     return out
 
 
+def merge_collections_ordered(*args) -> list:
+    """
+    Merges collections into one list without duplicates, keeping first-seen order.
+    """
+    out = {}
+    for li in args:
+        out.update(dict.fromkeys(li))
+    return list(out)
+
+
 def safe_remove(elements: list, element):
     if element in elements:
         elements.remove(element)
@@ -1,7 +1,42 @@
+import os
 from pathlib import Path
-DEFAULT_INSTALL_ROOT = Path("/opt/dumb_builds")
-DEFAULT_BIN_DIR = Path("/usr/local/bin")
+# DUMB_INSTALL_ROOT and DUMB_BIN_DIR move everything din writes somewhere else,
+# used by the benchmarks to run against a throwaway install root and bin dir
+DEFAULT_INSTALL_ROOT = Path(os.environ.get("DUMB_INSTALL_ROOT", "/opt/dumb_builds"))
+DEFAULT_BIN_DIR = Path(os.environ.get("DUMB_BIN_DIR", "/usr/local/bin"))
+SYSTEM_LOCATIONS = "DUMB_INSTALL_ROOT" not in os.environ or "DUMB_BIN_DIR" not in os.environ
 CONFIG_FILE = "dumb_build.toml"
 SHABANG = "#!/usr/bin/env sh"
 METADATA_FILE = ".dumb_install_metadata.json"
-GIT_CLONE_DIR = Path("/tmp/dumb_installer_clones")
+# url installs are cloned here, on the install root's filesystem, so moving the
+# checkout into place is a rename instead of a copy
+GIT_CLONE_DIR = DEFAULT_INSTALL_ROOT / ".clones"
+# archives are unpacked here for the same reason
+UNPACK_DIR = DEFAULT_INSTALL_ROOT / ".unpack"
+MANIFEST_FILE = ".dumb_install_manifest.json"
+DEFAULT_UPDATE_JOBS = 4
+# git repacks an install once it has more loose objects or packs than these,
+# the same defaults git uses for gc.auto and gc.autoPackLimit
+MAINTENANCE_MAX_LOOSE_OBJECTS = 6700
+MAINTENANCE_MAX_PACKS = 50
+STORE_DIR = DEFAULT_INSTALL_ROOT / ".dumb_store"
+# bare mirrors of the remotes of installs made with --mirror
+MIRROR_DIR = DEFAULT_INSTALL_ROOT / ".dumb_mirrors"
+# virtualenvs of installs with requirements, one per install and requirements hash,
+# each version links to its venv through VENV_LINK. wheels downloaded for them are
+# kept in WHEEL_CACHE_DIR so installs sharing packages fetch them once
+VENV_DIR = DEFAULT_INSTALL_ROOT / ".venvs"
+WHEEL_CACHE_DIR = DEFAULT_INSTALL_ROOT / ".dumb_wheels"
+VENV_LINK = ".dumb_venv"
+# number of versions of each install kept around for din --rollback
+KEEP_VERSIONS = 3
+# din --watch syncs once a source has been quiet for this many seconds,
+# the polling fallback rescans the sources every WATCH_POLL_INTERVAL seconds
+WATCH_DEBOUNCE = 0.2
+WATCH_POLL_INTERVAL = 1.0
+# how the executable in the bin dir runs the command, see wrapper_utils.write_wrapper
+WRAPPER_SHELL = "shell"
+WRAPPER_EXEC = "exec"
+WRAPPER_DIRECT = "direct"
+WRAPPER_MODES = (WRAPPER_SHELL, WRAPPER_EXEC, WRAPPER_DIRECT)
+REGISTRY_FILE = DEFAULT_INSTALL_ROOT / ".dumb_registry.sqlite3"
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# files up to this size are compared with a single read each, a loop of small
+# reads costs more in syscalls than the comparison itself
+SINGLE_READ_LIMIT = 1024 * 1024
+# bigger files are read into two reused buffers of this size
+COMPARE_BUFFER = 256 * 1024
+# files from this size on are compared or hashed on a thread pool, reads and hashlib
+# release the GIL, so a few huge files don't hold up everything else in a tree
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+IO_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+def contents_differ(path1: str, path2: str) -> bool:
+    """
+    Compares two files of the same size byte by byte, picking the strategy by size.
+    """
+    with open(path1, "rb", buffering=0) as f1, open(path2, "rb", buffering=0) as f2:
+        size = os.fstat(f1.fileno()).st_size
+        if size <= SINGLE_READ_LIMIT:
+            # reading one byte past the size catches a file that grew since it was stat'ed
+            return f1.read(size + 1) != f2.read(size + 1)
+        return _buffers_differ(f1, f2)
+
+
+def _buffers_differ(f1, f2) -> bool:
+    if hasattr(os, "posix_fadvise"):
+        for f in (f1, f2):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    buffer1 = bytearray(COMPARE_BUFFER)
+    buffer2 = bytearray(COMPARE_BUFFER)
+    view1 = memoryview(buffer1)
+    view2 = memoryview(buffer2)
+    while True:
+        read1 = f1.readinto(buffer1)
+        read2 = f2.readinto(buffer2)
+        if read1 != read2:
+            return True
+        if read1 == 0:
+            return False
+        if read1 == COMPARE_BUFFER:
+            # whole buffers compare without slicing out a copy
+            if buffer1 != buffer2:
+                return True
+        elif view1[:read1] != view2[:read2]:
+            return True
+
+
+class ParallelContents:
+    """
+    Runs the comparisons and hashes of big files on a thread pool while the caller keeps
+    walking its tree, small files are cheaper to do inline. The pool is only started
+    once a big file shows up. Use as a context manager, leaving it cancels what's queued.
+    """
+
+    def __init__(self, workers: int = IO_WORKERS):
+        self.workers = workers
+        self._pool = None
+
+    def submit(self, function, *args):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self._pool.submit(function, *args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
@@ -0,0 +1,143 @@
+import errno
+import os
+import shutil
+import threading
+from collections import Counter
+
+# linux ioctl for cloning a whole file, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+REFLINK = "reflink"
+COPY_FILE_RANGE = "copy_file_range"
+SENDFILE = "sendfile"
+PLAIN_COPY = "copy"
+
+STRATEGIES = (REFLINK, COPY_FILE_RANGE, SENDFILE, PLAIN_COPY)
+
+# errors meaning "this strategy can't do this copy", anything else is a real failure
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+
+def _reflink(src_fd: int, dst_fd: int, size: int) -> None:
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> None:
+    remaining = size
+    while remaining > 0:
+        copied = os.copy_file_range(src_fd, dst_fd, remaining)
+        if copied == 0:
+            break
+        remaining -= copied
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> None:
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def _plain_copy(src_fd: int, dst_fd: int, size: int) -> None:
+    while True:
+        buf = os.read(src_fd, 1024 * 1024)
+        if not buf:
+            break
+        os.write(dst_fd, buf)
+
+
+_BACKENDS = {
+    REFLINK: _reflink,
+    COPY_FILE_RANGE: _copy_file_range,
+    SENDFILE: _sendfile,
+    PLAIN_COPY: _plain_copy,
+}
+
+
+class CopyEngine:
+    """
+    Copies files with the cheapest strategy the filesystems allow, trying
+    FICLONE reflinks, then copy_file_range, then sendfile and finally a plain copy.
+    A strategy that fails as unsupported is skipped for the rest of the run for
+    that pair of devices. Can be passed as copytree's copy_function.
+    """
+
+    def __init__(self, strategies=STRATEGIES):
+        self.strategies = [s for s in strategies if self._available(s)]
+        # a plain copy always works, so it is always the last resort
+        if PLAIN_COPY not in self.strategies:
+            self.strategies.append(PLAIN_COPY)
+        self.counts = Counter()
+        self._unsupported: set[tuple[str, int, int]] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _available(strategy: str) -> bool:
+        if strategy == COPY_FILE_RANGE:
+            return hasattr(os, "copy_file_range")
+        if strategy == SENDFILE:
+            return hasattr(os, "sendfile")
+        return True
+
+    def copy_file(self, src: str, dst: str) -> str:
+        """
+        Copies src's content, mode and timestamps to dst like shutil.copy2,
+        returns the name of the strategy used.
+        """
+        with open(src, "rb") as fsrc:
+            src_stat = os.fstat(fsrc.fileno())
+            with open(dst, "wb") as fdst:
+                dst_dev = os.fstat(fdst.fileno()).st_dev
+                strategy = self._copy_fds(
+                    fsrc.fileno(), fdst.fileno(), src_stat.st_size, src_stat.st_dev, dst_dev)
+
+        shutil.copystat(src, dst)
+        with self._lock:
+            self.counts[strategy] += 1
+        return strategy
+
+    def _copy_fds(self, src_fd: int, dst_fd: int, size: int, src_dev: int, dst_dev: int) -> str:
+        for strategy in self.strategies:
+            key = (strategy, src_dev, dst_dev)
+            if key in self._unsupported:
+                continue
+
+            try:
+                _BACKENDS[strategy](src_fd, dst_fd, size)
+                return strategy
+            except OSError as e:
+                if strategy == PLAIN_COPY or e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                with self._lock:
+                    self._unsupported.add(key)
+                # start over, a partial copy may have been written
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+                os.ftruncate(dst_fd, 0)
+
+        raise OSError(errno.ENOTSUP, "no copy strategy available")
+
+    def __call__(self, src, dst, *, follow_symlinks=True):
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        if not follow_symlinks and os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+            return dst
+        self.copy_file(src, dst)
+        return dst
+
+    def summary(self) -> str:
+        if not self.counts:
+            return "no files copied"
+        return ", ".join(f"{name}: {self.counts[name]}" for name in STRATEGIES if self.counts[name])
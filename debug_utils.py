@@ -1,8 +1,7 @@
 import sys
-from typing import Optional
 
 
-def print_debug(*values, sep: Optional[str], end: Optional[str], file: Optional[str], flush: bool = False):
+def print_debug(*values, sep: str | None, end: str | None, file: str | None, flush: bool = False):
     print(*values, sep=sep, end=end, file=file, flush=flush)
 
 
@@ -1,53 +1,52 @@
 import os
-import shutil
-import stat
-from debug_utils import error
-from pathlib import Path
 import argparse
-from build_config_utils import BuildConfig
-from file_utils import directories_differ, copy_project, remove_excluded
-from git_wrapper import GitWrapper
-from constants import SHABANG, METADATA_FILE, DEFAULT_INSTALL_ROOT
-from constants import DEFAULT_BIN_DIR, CONFIG_FILE, GIT_CLONE_DIR
-from meta_data import MetaData
+from pathlib import Path
+from typing import TYPE_CHECKING
+from debug_utils import error
+from constants import DEFAULT_INSTALL_ROOT, DEFAULT_BIN_DIR, GIT_CLONE_DIR, SYSTEM_LOCATIONS
+from constants import MIRROR_DIR, CONFIG_FILE, UNPACK_DIR, VENV_LINK
+from constants import DEFAULT_UPDATE_JOBS, MAINTENANCE_MAX_LOOSE_OBJECTS, MAINTENANCE_MAX_PACKS
+from constants import WATCH_DEBOUNCE, VENV_DIR
+
+if TYPE_CHECKING:
+    import datetime
+
+# din is started for every command, so each command imports only the modules it needs instead
+# of everything up front. benchmarks/startup.py checks the import budget of each command.
 
 # TODO: allow user to override install locations, maybe  do a separate user_space vs system install
 # using ~/.local/bin and I don't kkow what for the opt mayble local state?
 
 
 def require_root() -> None:
-    if os.geteuid() != 0:
+    # with both locations overridden din only writes where the caller pointed it
+    if SYSTEM_LOCATIONS and os.geteuid() != 0:
         error("must be run as root")
 
 
-def write_wrapper(executable_name: str, command: str, project_dir: Path, bin_dir: Path):
-    bin_dir.mkdir(parents=True, exist_ok=True)
-
-    wrapper_path = bin_dir / executable_name
-
-    script = f'{SHABANG}\ndumb_project_dir={project_dir}\n{command} "$@"'
-
-    wrapper_path.write_text(script)
-    wrapper_path.chmod(
-        stat.S_IRUSR
-        | stat.S_IWUSR
-        | stat.S_IXUSR
-        | stat.S_IRGRP
-        | stat.S_IXGRP
-        | stat.S_IROTH
-        | stat.S_IXOTH
-    )
-
-
 def delete_from_path(p: Path):
     if not p.exists():
         return
     elif p.is_file() or p.is_symlink():
         p.unlink()
     elif p.is_dir():
+        import shutil
         shutil.rmtree(p)
 
 
+def remove_scratch(path: Path) -> None:
+    """
+    Deletes a clone or unpacked archive and the directory holding them once it's empty.
+    """
+    delete_from_path(path)
+    if is_empty_dir(path.parent):
+        path.parent.rmdir()
+
+
+def archive_source(archive: str) -> str:
+    return "stdin" if archive == "-" else str(Path(archive).resolve())
+
+
 def filter_out_git_affecting_patterns(patterns: list[str]):
     out = []
     for p in patterns:
@@ -65,76 +64,345 @@ def is_empty_dir(p: Path):
     return p.exists() and p.is_dir() and not any(p.iterdir())
 
 
-def update_executable(executable_name: str) -> None:
-    print(f"Updating {executable_name}...")
-    install_dir = DEFAULT_INSTALL_ROOT / executable_name
-    if not install_dir.exists():
-        print(f"Failed: couldn't find source directory at {install_dir}")
+def format_time(timestamp: float | None) -> str:
+    import datetime
+    if timestamp is None:
+        return "-"
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def list_installs() -> None:
+    from registry import Registry
+    rows = Registry().all()
+    if not rows:
+        print("no programs installed")
         return
 
-    meta_data = MetaData().update_from(install_dir)
-    is_git = meta_data.is_git_install
+    print(f"{'NAME':<20}{'TYPE':<9}{'REVISION':<10}{'VERSION':<9}{'UPDATED':<21}RESULT")
+    for row in rows:
+        kind = "git" if row["is_git"] else "archive" if row.get("archive") else "local"
+        revision = (row["revision"] or "-")[:8]
+        print(f"{row['name']:<20}{kind:<9}{revision:<10}{row['version'] or '-':<9}"
+              f"{format_time(row['updated_at']):<21}{row['last_result'] or '-'}")
+
+
+def show_status(executable_name: str) -> None:
+    from registry import Registry
+    row = Registry().get(executable_name)
+    if row is None:
+        print(f"{executable_name} is not installed")
+        exit(1)
+
+    for key in ("is_git", "dedup", "mirror", "sparse", "archive"):
+        if row.get(key) is not None:
+            row[key] = bool(row[key])
+    row["installed_at"] = format_time(row["installed_at"])
+    row["updated_at"] = format_time(row["updated_at"])
+    width = max(len(key) for key in row)
+    for key, value in row.items():
+        print(f"{key:<{width}}  {value if value is not None else '-'}")
+
+
+def in_window(window: str, now: "datetime.time") -> bool:
+    """
+    window has the form HH:MM-HH:MM and may wrap past midnight, like 23:00-05:00.
+    """
+    import datetime
+    try:
+        start_text, end_text = window.split("-")
+        start = datetime.time.fromisoformat(start_text)
+        end = datetime.time.fromisoformat(end_text)
+    except ValueError:
+        error(f"invalid maintenance window '{window}', expected HH:MM-HH:MM")
+
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+def run_maintenance(target: str, window: str = None, force: bool = False) -> None:
+    """
+    Repacks git installs whose object counts exceed the maintenance thresholds.
+    target is an executable name or "all". With a window nothing runs outside of it,
+    so din --maintenance can be scheduled often and only do work off-peak.
+    """
+    import datetime
+    from git_wrapper import GitWrapper
+    from registry import Registry
+    from timing_utils import for_install
+    from update_utils import registered_names
+
+    if window and not in_window(window, datetime.datetime.now().time()):
+        print(f"outside maintenance window {window}, skipping")
+        return
 
-    if is_git:
-        git_wrapper = GitWrapper()
-        result = git_wrapper.updateRepoAtPath(install_dir)
-        if not result.success:
-            if "already up to date" in result.failureMessage:
-                print("already up to date")
-            else:
-                print(f"Failed to update: {result.failureMessage}")
+    if target == "all":
+        registered_names()
+        names = [row["name"] for row in Registry().all() if row["is_git"]]
+    else:
+        names = [target]
+    git_wrapper = GitWrapper()
+
+    for name in names:
+        install_dir = DEFAULT_INSTALL_ROOT / name
+        if not (install_dir / ".git").exists():
+            continue
+
+        if not force and not git_wrapper.needs_maintenance(
+                install_dir, MAINTENANCE_MAX_LOOSE_OBJECTS, MAINTENANCE_MAX_PACKS):
+            print(f"{name}: below maintenance thresholds")
+            continue
+
+        loose, packs = git_wrapper.object_counts(install_dir)
+        print(f"{name}: repacking ({loose} loose objects, {packs} packs)...")
+        with for_install(name):
+            result = git_wrapper.run_maintenance(install_dir)
+        if result.success:
+            print(f"{name}: done")
         else:
-            # incase something was added or deleted from the excluded section's
+            print(f"{name}: failed: {result.failureMessage}")
 
-            build = BuildConfig.safe_get_build_config(install_dir)
 
-            if build:
-                remove_excluded(install_dir, build.get_remote_excluded_files())
-            else:
-                print("no build file found during update")
+def export_install(executable_name: str, output: str | None) -> None:
+    """
+    Writes the active version of an install as a bundle din --import installs elsewhere.
+    """
+    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    if not install_dir.exists():
+        error(f"{executable_name} is not installed")
+
+    from archive_utils import export_bundle, BundleError
+    from build_config_utils import BuildConfig
+    from git_wrapper import GitWrapper
+    from manifest import Manifest
+    from meta_data import MetaData
+    from update_utils import INTERNAL_PATTERNS
+
+    # resolve once, a later update swapping the version mustn't mix two trees in one bundle
+    install_dir = install_dir.resolve()
+    build = BuildConfig.safe_get_build_config(install_dir)
+    if build is None:
+        error(f"{executable_name} has no readable {CONFIG_FILE}, it can't be exported")
+    meta_data = MetaData().update_from(install_dir)
 
-            print("updated")
-        return
+    # the tree is already filtered, only din's own files, .git and generated bytecode stay behind
+    exclude = build.get_generated_matcher().extended([*INTERNAL_PATTERNS, ".git"])
+    manifest = Manifest.build(install_dir, exclude, meta_data.manifest)
+    header = {
+        "name": executable_name,
+        "config": dict(build.resolved(), executable_name=executable_name),
+        "metadata": meta_data.as_dict(),
+        "revision": GitWrapper().head_revision(install_dir) if meta_data.is_git_install else None,
+        "version": install_dir.name,
+    }
+
+    output = output or f"{executable_name}.dinbundle.tar.gz"
+    try:
+        stats = export_bundle(header, install_dir, manifest, output)
+    except (BundleError, OSError) as e:
+        error(f"Failed to export {executable_name}: {e}")
+    if output != "-":
+        print(f"Exported '{executable_name}' to {output}: {stats.files} files ({stats.bytes} bytes)")
 
-    source_dir = meta_data.source_path
-    if source_dir is None:
-        print("No source directory path")
-        return
 
-    if not source_dir.exists():
-        print(f"Failed: couldn't find source directory at {source_dir}")
-        return
+def is_required_by_git(pattern):
+    pass
 
-    if not (source_dir / CONFIG_FILE).exists():
-        print(f"Failed: couldn't find source directory at {source_dir}")
-        return
 
-    build = BuildConfig(source_dir)
+def install(url: str | None, name: str | None, dedup: bool, mirror: bool = False,
+            sparse: bool = False, archive: str | None = None,
+            bundle: str | None = None) -> None:
+    from build_config_utils import BuildConfig
+    from file_utils import sync_project, remove_excluded
+    from git_wrapper import GitWrapper, sparse_checkout_patterns
+    from install_versions import VersionedInstall
+    from meta_data import MetaData
+    from wrapper_utils import write_wrapper
+    from update_utils import INTERNAL_PATTERNS, dedup_install, precompile_install
+    from update_utils import collect_store_garbage, count_copied, venv_install, refresh_venv
+    from timing_utils import phase, set_install
+
+    is_git_install = bool(url)
+    # a clone or unpacked archive on the install root's filesystem, renamed in as the staging dir
+    scratch = None
+    if is_git_install:
+        git_wrapper = GitWrapper()
+        if not git_wrapper.is_git_installed():
+            error("Git is not installed or not available in PATH")
 
-    exclude = build.get_local_excluded_files()
-    # add the metadata file for the directoires_differ cal
-    exclude.append(METADATA_FILE)
-    if not directories_differ(install_dir, source_dir, exclude):
-        print("already up to date")
-        return
+        GIT_CLONE_DIR.mkdir(parents=True, exist_ok=True)
+        clone_path = scratch = GIT_CLONE_DIR / str(os.getpid())
+        reference = None
+        if mirror:
+            with phase("mirror"):
+                mirror_result = git_wrapper.update_mirror(url, MIRROR_DIR)
+            if mirror_result.success:
+                reference = git_wrapper.mirror_path(url, MIRROR_DIR)
+            else:
+                print(f"Failed to update the mirror, cloning without it: {mirror_result.failureMessage}")
+                mirror = False
+        with phase("clone"):
+            clone_result = git_wrapper.cloneTo(url, str(clone_path), reference, sparse)
+        if not clone_result.success:
+            print(f"Failed to clone repository: {clone_result.failureMessage}")
+            remove_scratch(clone_path)
+            exit(1)
 
-    copy_project(source_dir, install_dir, exclude)
-    data = MetaData(is_git_install=is_git, source_path=source_dir)
-    data.write(install_dir)
-    print("updated")
+        project_root = clone_path.resolve()
 
+        try:
+            with phase("config"):
+                if sparse:
+                    # nothing is checked out yet, the excludes decide what will be
+                    text = git_wrapper.read_file(project_root, CONFIG_FILE)
+                    if text is None:
+                        error(f"{CONFIG_FILE} not found in the repository")
+                    build = BuildConfig(text=text)
+                else:
+                    build = BuildConfig(project_root)
+        except SystemExit:
+            print("Failed to install: could not load config from cloned repository")
+            remove_scratch(clone_path)
+            exit(1)
 
-def update_all() -> None:
-    if not DEFAULT_INSTALL_ROOT.exists():
-        return
+        if sparse:
+            with phase("checkout"):
+                checkout_result = git_wrapper.checkout(
+                    project_root, sparse_checkout_patterns(build.get_remote_excluded_files()))
+            if not checkout_result.success:
+                print(f"Failed to check out repository: {checkout_result.failureMessage}")
+                remove_scratch(clone_path)
+                exit(1)
+    elif archive is not None:
+        from archive_utils import extract_archive
+
+        UNPACK_DIR.mkdir(parents=True, exist_ok=True)
+        scratch = UNPACK_DIR / str(os.getpid())
+        delete_from_path(scratch)
+        scratch.mkdir()
+        try:
+            with phase("extract"):
+                project_root, build, extract_stats = extract_archive(archive, scratch)
+        except SystemExit:
+            remove_scratch(scratch)
+            raise
+        except Exception as e:
+            print(f"Failed to install from archive: {e}")
+            remove_scratch(scratch)
+            exit(1)
+    elif bundle is not None:
+        from archive_utils import import_bundle
+        from manifest import Manifest
+
+        UNPACK_DIR.mkdir(parents=True, exist_ok=True)
+        project_root = scratch = UNPACK_DIR / str(os.getpid())
+        delete_from_path(scratch)
+        scratch.mkdir()
+        try:
+            with phase("import"):
+                header, extract_stats = import_bundle(bundle, scratch)
+            build = BuildConfig(resolved=header["config"])
+        except SystemExit:
+            remove_scratch(scratch)
+            raise
+        except Exception as e:
+            print(f"Failed to import bundle: {e}")
+            remove_scratch(scratch)
+            exit(1)
+        # the files were checked against these hashes, the manifest rebuild reuses them
+        bundle_manifest = Manifest(header["manifest"], header["exclude"])
+    else:
+        project_root = Path.cwd().resolve()
+        with phase("config"):
+            build = BuildConfig(project_root)
 
-    for entry in DEFAULT_INSTALL_ROOT.iterdir():
-        if entry.is_dir():
-            update_executable(entry.name)
+    executable_name = build.executable_name
+    command = build.command
+    if name:
+        executable_name = name
+    set_install(executable_name)
 
+    if scratch is not None:
+        exclude = build.get_remote_exclude_matcher(*INTERNAL_PATTERNS)
+    else:
+        exclude = build.get_local_exclude_matcher(*INTERNAL_PATTERNS)
+    # the files din writes itself, everything else the excludes match leaves the install
+    keep = build.get_generated_matcher().extended(INTERNAL_PATTERNS)
 
-def is_required_by_git(pattern):
-    pass
+    DEFAULT_INSTALL_ROOT.mkdir(parents=True, exist_ok=True)
+
+    bin_dir = DEFAULT_BIN_DIR
+    versioned = VersionedInstall(executable_name)
+    install_dir = versioned.link
+
+    manifest_exclude = exclude.extended([".git"]) if is_git_install else exclude
+    meta_data = MetaData(is_git_install=is_git_install,
+                         source_path=project_root if scratch is None else None,
+                         dedup=dedup, mirror=mirror, sparse=sparse,
+                         source_url=git_wrapper.resolve_url(url) if is_git_install else None,
+                         source_archive=archive_source(archive or bundle)
+                         if archive or bundle else None)
+    if bundle is not None:
+        meta_data.manifest = bundle_manifest
+
+    # build the new version next to the live one, then swap it in atomically.
+    # a clone or unpacked archive becomes the staging directory as is, a clone has its
+    # excludes removed in place. a local project is synced into a staging directory
+    # seeded from the active version
+    stats = None
+    if scratch is not None:
+        with phase("stage"):
+            try:
+                staging = versioned.stage_from(project_root)
+            finally:
+                remove_scratch(scratch)
+    else:
+        with phase("manifest"):
+            meta_data.rebuild_manifest(project_root, manifest_exclude)
+        with phase("stage"):
+            staging = versioned.stage()
+    try:
+        if scratch is not None:
+            if is_git_install:
+                with phase("remove excluded"):
+                    remove_excluded(staging, exclude, keep=build.get_generated_matcher())
+            with phase("manifest"):
+                meta_data.rebuild_manifest(staging, manifest_exclude)
+        else:
+            with phase("sync"):
+                stats = sync_project(project_root, staging, exclude, keep=keep)
+            count_copied(stats)
+        meta_data.write(staging)
+        dedup_install(staging, meta_data)
+        precompile_install(staging, build, manifest_exclude, install_dir)
+        venv_install(staging, build, staging if scratch is not None else project_root,
+                     executable_name)
+    except BaseException:
+        versioned.discard(staging)
+        raise
+
+    with phase("activate"):
+        version = versioned.activate(staging)
+    revision = git_wrapper.head_revision(install_dir) if is_git_install else None
+    with phase("registry"):
+        meta_data.register(executable_name, revision, version.name)
+    refresh_venv(executable_name)
+    collect_store_garbage()
+    venv = install_dir / VENV_LINK if build.requirements is not None else None
+    with phase("wrapper"):
+        wrapper_mode = write_wrapper(executable_name, command, install_dir, bin_dir, build.wrapper,
+                                     venv)
+
+    print(f"Installed '{executable_name}' system-wide")
+    print(f"Project location: {install_dir}")
+    if stats is not None:
+        print(f"Copied: {stats.summary()}")
+    if archive is not None:
+        print(f"Extracted: {extract_stats.summary()}")
+    if bundle is not None:
+        print(f"Imported: {extract_stats.files} files ({extract_stats.bytes} bytes), "
+              "verified against the bundle's manifest")
+    print(f"Executable: {DEFAULT_BIN_DIR / executable_name} ({wrapper_mode} wrapper)")
 
 
 def main() -> None:
@@ -157,6 +425,82 @@ def main() -> None:
     parser.add_argument(
         "--update-all", action="store_true", help="Update all installed executables"
     )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=DEFAULT_UPDATE_JOBS,
+        help=f"Number of installs --update-all updates concurrently (default {DEFAULT_UPDATE_JOBS})"
+    )
+    parser.add_argument(
+        "--maintenance", nargs="?", const="all", metavar="NAME",
+        help="Repack git installs over the maintenance thresholds, all of them unless NAME is given"
+    )
+    parser.add_argument(
+        "--maintenance-window", type=str, metavar="HH:MM-HH:MM",
+        help="Only run --maintenance inside this time window, for scheduling it off-peak"
+    )
+    parser.add_argument(
+        "--force-maintenance", action="store_true",
+        help="Run --maintenance regardless of the thresholds"
+    )
+    parser.add_argument(
+        "--watch", type=str, metavar="NAME",
+        help="Keep syncing changes in the source directory of a local install, or of all of them for all"
+    )
+    parser.add_argument(
+        "--poll", action="store_true",
+        help="Make --watch rescan the sources instead of using inotify, for network filesystems"
+    )
+    parser.add_argument(
+        "--debounce", type=float, default=WATCH_DEBOUNCE, metavar="SECONDS",
+        help=f"How long a source has to be quiet before --watch syncs it (default {WATCH_DEBOUNCE})"
+    )
+    parser.add_argument(
+        "--rollback", type=str, metavar="NAME",
+        help="Switch an install back to its previous version"
+    )
+    parser.add_argument(
+        "--list", action="store_true",
+        help="List installed programs from the install registry"
+    )
+    parser.add_argument(
+        "--status", type=str, metavar="NAME",
+        help="Show everything the install registry knows about an install"
+    )
+    parser.add_argument(
+        "--dedup", action="store_true",
+        help="Hardlink the install's files into a shared content addressed store under the install root"
+    )
+    parser.add_argument(
+        "--mirror", action="store_true",
+        help="Clone and update through a shared bare mirror of the remote under the install root"
+    )
+    parser.add_argument(
+        "--sparse", action="store_true",
+        help="Clone without file contents and only check out what the excludes leave, for url installs"
+    )
+    parser.add_argument(
+        "--archive", type=str, metavar="FILE",
+        help="Install from a .tar, .tar.gz, .tar.xz or .tar.zst archive, - reads it from stdin"
+    )
+    parser.add_argument(
+        "--export", type=str, metavar="NAME",
+        help="Write an install as a bundle for --import, to NAME.dinbundle.tar.gz unless --output is given"
+    )
+    parser.add_argument(
+        "--output", type=str, metavar="FILE",
+        help="Where --export writes the bundle, .tar, .tar.gz or .tar.xz, - writes it to stdout"
+    )
+    parser.add_argument(
+        "--import", dest="import_bundle", type=str, metavar="FILE",
+        help="Verify and install a bundle written by --export, - reads it from stdin"
+    )
+    parser.add_argument(
+        "--timings", nargs="?", const="table", choices=["table", "json"],
+        help="Print how long each phase took per install to stderr, as a table or as json"
+    )
+    parser.add_argument(
+        "--trace", type=Path, metavar="FILE",
+        help="Write the phases as a Chrome trace (chrome://tracing, Perfetto) to FILE"
+    )
     parser.add_argument(
         "url",
         nargs="?",
@@ -164,23 +508,67 @@ def main() -> None:
         help="Git repository URL to install from",
     )
 
-    require_root()
-
     args = parser.parse_args()
 
+    if not args.timings and not args.trace:
+        run(args)
+        return
+
+    import timing_utils
+    recorder = timing_utils.enable()
+    try:
+        run(args)
+    finally:
+        recorder.report(args.timings, args.trace)
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.list or args.status:
+        from registry import Registry
+        from install_versions import installed_names
+        if not Registry().exists() and installed_names():
+            if SYSTEM_LOCATIONS and os.geteuid() != 0:
+                error("the install registry hasn't been built yet, run sudo din --list once")
+            from update_utils import rebuild_registry
+            rebuild_registry()
+        if args.list:
+            list_installs()
+        else:
+            show_status(args.status)
+        exit()
+
+    if args.export:
+        export_install(args.export, args.output)
+        exit()
+
+    require_root()
+
     if args.exe_uninstall:
         bin_path = DEFAULT_BIN_DIR / args.exe_uninstall
         dumb_path = DEFAULT_INSTALL_ROOT / args.exe_uninstall
 
-        if not bin_path.exists() and not dumb_path.exists():
+        if not bin_path.exists() and not dumb_path.exists() and not dumb_path.is_symlink():
             print("program not found terminating.")
             exit(1)
+
+        from registry import Registry
+        from install_versions import VersionedInstall
+        from object_store import ObjectStore
+
         if bin_path.exists():
             print("deleting", bin_path)
             delete_from_path(bin_path)
-        if dumb_path.exists():
+        if dumb_path.exists() or dumb_path.is_symlink():
             print("deleting", dumb_path)
-            delete_from_path(dumb_path)
+            VersionedInstall(args.exe_uninstall).remove()
+        Registry().remove(args.exe_uninstall)
+        if (VENV_DIR / args.exe_uninstall).exists():
+            from venv_utils import remove_venvs
+            remove_venvs(args.exe_uninstall)
+
+        removed = ObjectStore().collect_garbage()
+        if removed:
+            print(f"removed {removed} unreferenced blobs from the object store")
 
         if is_empty_dir(DEFAULT_INSTALL_ROOT):
             delete_from_path(DEFAULT_INSTALL_ROOT)
@@ -188,63 +576,43 @@ def main() -> None:
 
         exit()
 
+    if args.rollback:
+        from install_versions import VersionedInstall
+        from update_utils import record_update, refresh_venv, ROLLED_BACK
+
+        had_venv = os.path.islink(DEFAULT_INSTALL_ROOT / args.rollback / VENV_LINK)
+        version = VersionedInstall(args.rollback).rollback()
+        if version is None:
+            print(f"no older version of {args.rollback} to roll back to")
+            exit(1)
+        refresh_venv(args.rollback, had_venv)
+        print(f"rolled {args.rollback} back to version {version.name}")
+        record_update(args.rollback, ROLLED_BACK, f"version {version.name}")
+        exit()
+
     if args.update:
+        from update_utils import update_executable, collect_store_garbage
         update_executable(args.update)
+        collect_store_garbage()
         exit()
 
     if args.update_all:
-        update_all()
+        from update_utils import update_all
+        update_all(args.jobs)
         exit()
 
-    is_git_install = args.url
-    if is_git_install:
-        git_wrapper = GitWrapper()
-        if not git_wrapper.is_git_installed():
-            error("Git is not installed or not available in PATH")
-
-        GIT_CLONE_DIR.mkdir(parents=True, exist_ok=True)
-        temp_clone_path = GIT_CLONE_DIR / f"temp_clone_{os.getpid()}"
-        clone_result = git_wrapper.cloneTo(args.url, str(temp_clone_path))
-        if not clone_result.success:
-            print(f"Failed to clone repository: {clone_result.failureMessage}")
-            delete_from_path(temp_clone_path)
-            exit(1)
-
-        project_root = temp_clone_path.resolve()
-
-        try:
-            build = BuildConfig(project_root)
-        except SystemExit:
-            print("Failed to install: could not load config from cloned repository")
-            delete_from_path(temp_clone_path)
-            exit(1)
-    else:
-        project_root = Path.cwd().resolve()
-        build = BuildConfig(project_root)
-
-    executable_name = build.executable_name
-    command = build.command
-    if args.name:
-        executable_name = args.name
-
-    if is_git_install:
-        exclude = build.get_remote_excluded_files()
-    else:
-        exclude = build.get_local_excluded_files()
-
-    DEFAULT_INSTALL_ROOT.mkdir(parents=True, exist_ok=True)
-
-    bin_dir = DEFAULT_BIN_DIR
-    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    if args.maintenance:
+        run_maintenance(args.maintenance, args.maintenance_window,
+                        args.force_maintenance)
+        exit()
 
-    copy_project(project_root, install_dir, exclude)
-    MetaData(is_git_install=is_git_install,
-             source_path=project_root).write(install_dir)
-    write_wrapper(executable_name, command, install_dir, bin_dir)
+    if args.watch:
+        from watch_utils import watch
+        watch(args.watch, args.debounce, args.poll)
+        exit()
 
-    print(f"Installed '{executable_name}' system-wide")
-    print(f"Project location: {install_dir}")
-    print(f"Executable: {DEFAULT_BIN_DIR / executable_name}")
+    install(args.url, args.name, args.dedup, args.mirror, args.sparse, args.archive,
+            args.import_bundle)
 
 
 if __name__ == "__main__":
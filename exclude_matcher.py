@@ -0,0 +1,204 @@
+import re
+from typing import Iterable
+
+
+def _class_end(pattern: str, start: int) -> int:
+    """
+    Index of the ] closing the class opened at start, -1 if it is never closed.
+    A ] right after [ or [! is part of the class, like in gitignore and fnmatch.
+    """
+    i = start + 1
+    if i < len(pattern) and pattern[i] in "!^":
+        i += 1
+    first = i
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "]" and i > first:
+            return i
+        i += 1
+    return -1
+
+
+def _translate_class(body: str) -> str:
+    """
+    The regex for the inside of a [class], every character is escaped so nothing in it
+    means anything to re apart from ranges. Like gitignore, [!a] and [^a] both negate,
+    and a class never matches a /.
+    """
+    negate = body[:1] in ("!", "^")
+    if negate:
+        body = body[1:]
+
+    chars = []
+    i = 0
+    while i < len(body):
+        if body[i] == "\\" and i + 1 < len(body):
+            i += 1
+        chars.append(body[i])
+        i += 1
+
+    out = []
+    i = 0
+    while i < len(chars):
+        if i + 2 < len(chars) and chars[i + 1] == "-":
+            out.append(f"{re.escape(chars[i])}-{re.escape(chars[i + 2])}")
+            i += 3
+        else:
+            out.append(re.escape(chars[i]))
+            i += 1
+    inner = "".join(out)
+    return f"[^/{inner}]" if negate else f"(?!/)[{inner}]"
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translates a gitignore style glob to a regex. * and ? never match a /,
+    ** matches across directories, a backslash makes the next character literal.
+    """
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "\\":
+            if i + 1 == n:
+                # gitignore treats a trailing backslash as an invalid pattern, it never matches
+                return "(?!)"
+            out.append(re.escape(pattern[i + 1]))
+            i += 1
+        elif c == "*":
+            if pattern.startswith("**", i):
+                i += 2
+                if pattern.startswith("/", i):
+                    # a/**/b also matches a/b
+                    out.append("(?:.*/)?")
+                    i += 1
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = _class_end(pattern, i)
+            if end == -1:
+                # never closed, the [ is just a character like fnmatch has it
+                out.append(re.escape(c))
+            else:
+                out.append(_translate_class(pattern[i + 1:end]))
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class _Rule:
+    def __init__(self, pattern: str):
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        # like gitignore a / anywhere but the end anchors the pattern to the root,
+        # otherwise it matches a name at any depth
+        self.anchored = "/" in pattern
+        self.regex = _translate(pattern.lstrip("/"))
+
+
+def _combine(rules: list[_Rule]):
+    if not rules:
+        return None
+    return re.compile("|".join(f"(?:{r.regex})" for r in rules))
+
+
+class ExcludeMatcher:
+    """
+    Compiled form of an exclude list, shared by every walker so patterns are
+    compiled once. Patterns follow gitignore rules:
+
+    * `name` or `*.pyc` matches that name at any depth
+    * `/dist` or `build/**` is anchored to the project root
+    * a trailing `/` only matches directories
+    * `!pattern` re-includes what an earlier pattern excluded
+    * a backslash escapes the next character, `\\!name` matches a name starting with !
+
+    Paths are relative to the project root and use / as separator.
+    An excluded directory excludes everything inside it, walkers prune it without descending.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        # keep order, negations depend on it
+        self.patterns = list(dict.fromkeys(p for p in patterns if p and p != "!"))
+        rules = [_Rule(p) for p in self.patterns]
+        self._has_negation = any(r.negate for r in rules)
+
+        if self._has_negation:
+            # last matching rule wins, so rules are checked one by one
+            self._ordered = [
+                (re.compile(r.regex), r.negate, r.dir_only, r.anchored) for r in rules
+            ]
+        else:
+            # no negations, every pattern of a kind is merged into a single regex
+            self._name = _combine([r for r in rules if not r.anchored and not r.dir_only])
+            self._name_dir = _combine([r for r in rules if not r.anchored and r.dir_only])
+            self._path = _combine([r for r in rules if r.anchored and not r.dir_only])
+            self._path_dir = _combine([r for r in rules if r.anchored and r.dir_only])
+
+    @staticmethod
+    def of(exclude) -> "ExcludeMatcher":
+        """
+        Accepts a matcher or a list of patterns, so walkers take either.
+        """
+        if isinstance(exclude, ExcludeMatcher):
+            return exclude
+        return ExcludeMatcher(exclude or ())
+
+    def extended(self, patterns: Iterable[str]) -> "ExcludeMatcher":
+        return ExcludeMatcher(self.patterns + list(patterns))
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def matches(self, rel_path: str, is_dir: bool = False) -> bool:
+        """
+        Returns True if the entry at rel_path is excluded by itself,
+        without looking at its parent directories.
+        """
+        name = rel_path.rpartition("/")[2]
+
+        if self._has_negation:
+            excluded = False
+            for regex, negate, dir_only, anchored in self._ordered:
+                if dir_only and not is_dir:
+                    continue
+                if regex.fullmatch(rel_path if anchored else name):
+                    excluded = not negate
+            return excluded
+
+        if self._name and self._name.fullmatch(name):
+            return True
+        if self._path and self._path.fullmatch(rel_path):
+            return True
+        if is_dir:
+            if self._name_dir and self._name_dir.fullmatch(name):
+                return True
+            if self._path_dir and self._path_dir.fullmatch(rel_path):
+                return True
+        return False
+
+    def excludes(self, rel_path: str, is_dir: bool = False) -> bool:
+        """
+        Like matches but also True when any parent directory of rel_path is excluded,
+        for checking paths that didn't come from a pruned walk.
+        """
+        parts = rel_path.split("/")
+        for i in range(1, len(parts)):
+            if self.matches("/".join(parts[:i]), is_dir=True):
+                return True
+        return self.matches(rel_path, is_dir)
@@ -1,9 +1,43 @@
 from pathlib import Path
+from dataclasses import dataclass, field
+from content_utils import PARALLEL_MIN_SIZE, ParallelContents, contents_differ
+from copy_backends import CopyEngine
+from exclude_matcher import ExcludeMatcher
 import shutil
+import stat
 import os
 
 
-def copy_project(src: Path, dest: Path, exclude) -> None:
+@dataclass
+class SyncStats:
+    files_copied: int = 0
+    bytes_copied: int = 0
+    files_removed: int = 0
+    engine: CopyEngine = field(default_factory=CopyEngine)
+
+    def summary(self) -> str:
+        return (f"transferred {self.files_copied} files ({self.bytes_copied} bytes), "
+                f"removed {self.files_removed}, via {self.engine.summary()}")
+
+
+def ignore_for(root: Path, matcher: ExcludeMatcher):
+    """
+    Adapts a matcher to the ignore callable shutil.copytree expects.
+    """
+    root_str = str(root)
+
+    def ignore(dir_path, names):
+        rel = os.path.relpath(dir_path, root_str)
+        prefix = "" if rel == "." else rel.replace(os.sep, "/") + "/"
+        return {
+            name for name in names
+            if matcher.matches(prefix + name, os.path.isdir(os.path.join(dir_path, name)))
+        }
+    return ignore
+
+
+def copy_project(src: Path, dest: Path, exclude, engine: CopyEngine = None) -> CopyEngine:
+    engine = engine or CopyEngine()
     if dest.exists():
         shutil.rmtree(dest)
 
@@ -11,113 +45,370 @@ def copy_project(src: Path, dest: Path, exclude) -> None:
         src,
         dest,
         symlinks=True,
-        ignore=shutil.ignore_patterns(*exclude),
+        ignore=ignore_for(src, ExcludeMatcher.of(exclude)),
+        copy_function=engine,
     )
+    return engine
 
 
-def files_differ(path1: Path, path2: Path, chunk_size: int = 8192) -> bool:
-    """Compare two files efficiently with early exit."""
+@dataclass
+class TreeDiff:
+    """
+    Relative paths that differ between an old and a new tree.
+    A directory only in one tree is listed by itself, not by its contents.
+    mode_changed holds files whose content is the same but whose mode isn't.
+    """
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    mode_changed: list[str] = field(default_factory=list)
 
-    # Fast check: size mismatch
-    if path1.stat().st_size != path2.stat().st_size:
-        return True
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.modified or self.mode_changed)
 
-    # Compare contents in chunks
-    with path1.open("rb") as f1, path2.open("rb") as f2:
-        while True:
-            b1 = f1.read(chunk_size)
-            b2 = f2.read(chunk_size)
-            if b1 != b2:
-                return True
-            if not b1:  # EOF
-                return False
 
+class _FirstDifference(Exception):
+    pass
 
-def directories_differ(dir1: Path, dir2: Path, ignore_patterns=None) -> bool:
+
+def compare_trees(old: Path, new: Path, exclude=None, quick: bool = False,
+                  stop_at_first: bool = False, keep=None) -> TreeDiff:
     """
-    Return True if directories differ, False if identical.
-    Stops at first detected difference.
+    Walks both trees at once with os.scandir, reusing each DirEntry's stat.
+    Excluded paths are skipped on both sides, unless keep is given: then only what keep
+    matches is skipped in old and other excluded paths still in old are listed as removed,
+    so an install loses files its excludes started to cover.
+    By default files of the same size have their content compared. With quick a file
+    counts as unchanged when size and mtime match, like rsync, except for files with more
+    than one link (shared with an older version or the object store) whose mtime and write
+    bits may not be their own, they get their content compared when the mtime differs.
+    Either way a file whose content is the same but whose mode isn't is listed in
+    mode_changed. Big files are compared on a thread pool while the walk goes on.
     """
+    diff = TreeDiff()
+    matcher = ExcludeMatcher.of(exclude)
+    old_matcher = matcher if keep is None else ExcludeMatcher.of(keep)
+    parallel = ParallelContents()
+    # (rel_path, future, mode differs) of the big files still being compared
+    pending = []
 
-    ignore = (
-        shutil.ignore_patterns(*ignore_patterns)
-        if ignore_patterns
-        else None
-    )
+    def record(bucket: list[str], rel_path: str) -> None:
+        bucket.append(rel_path)
+        if stop_at_first:
+            raise _FirstDifference()
+
+    def scan(path: str, rel: str, matcher: ExcludeMatcher) -> dict[str, os.DirEntry]:
+        with os.scandir(path) as it:
+            entries = {e.name: e for e in it}
+        if matcher:
+            return {
+                name: e for name, e in entries.items()
+                if not matcher.matches(rel + name, e.is_dir(follow_symlinks=False))
+            }
+        return entries
+
+    def walk(old_dir: str, new_dir: str, rel: str) -> None:
+        old_entries = scan(old_dir, rel, old_matcher)
+        new_entries = scan(new_dir, rel, matcher)
+
+        for name in old_entries.keys() - new_entries.keys():
+            record(diff.removed, rel + name)
+
+        for name, new_entry in new_entries.items():
+            rel_path = rel + name
+            old_entry = old_entries.get(name)
+            if old_entry is None:
+                record(diff.added, rel_path)
+                continue
+
+            if new_entry.is_symlink() or old_entry.is_symlink():
+                if not (new_entry.is_symlink() and old_entry.is_symlink()
+                        and os.readlink(new_entry.path) == os.readlink(old_entry.path)):
+                    record(diff.modified, rel_path)
+                continue
+
+            new_is_dir = new_entry.is_dir()
+            if new_is_dir != old_entry.is_dir():
+                record(diff.modified, rel_path)
+            elif new_is_dir:
+                walk(old_entry.path, new_entry.path, rel_path + "/")
+            else:
+                compare_files(old_entry, new_entry, rel_path)
+
+    def compare_contents(old_entry: os.DirEntry, new_entry: os.DirEntry, rel_path: str,
+                         size: int, mode_differs: bool = False) -> None:
+        if size >= PARALLEL_MIN_SIZE:
+            pending.append((rel_path, parallel.submit(contents_differ, old_entry.path,
+                                                      new_entry.path), mode_differs))
+        elif contents_differ(old_entry.path, new_entry.path):
+            record(diff.modified, rel_path)
+        elif mode_differs:
+            record(diff.mode_changed, rel_path)
+
+    def compare_files(old_entry: os.DirEntry, new_entry: os.DirEntry, rel_path: str) -> None:
+        old_stat = old_entry.stat()
+        new_stat = new_entry.stat()
+        if old_stat.st_size != new_stat.st_size:
+            record(diff.modified, rel_path)
+            return
+
+        shared = old_stat.st_nlink > 1
+        # the write bits of a shared inode belong to the store, not this tree
+        mode_differs = bool((old_stat.st_mode ^ new_stat.st_mode) & (~0o222 if shared else ~0))
+        if shared and mode_differs:
+            # never chmod a shared inode, an exec bit change means a new copy
+            record(diff.modified, rel_path)
+        elif not quick:
+            compare_contents(old_entry, new_entry, rel_path, new_stat.st_size, mode_differs)
+        elif old_stat.st_mtime_ns != new_stat.st_mtime_ns:
+            if shared:
+                compare_contents(old_entry, new_entry, rel_path, new_stat.st_size)
+            else:
+                record(diff.modified, rel_path)
+        elif mode_differs:
+            record(diff.mode_changed, rel_path)
+
+    with parallel:
+        try:
+            walk(str(old), str(new), "")
+            for rel_path, future, mode_differs in pending:
+                if future.result():
+                    record(diff.modified, rel_path)
+                elif mode_differs:
+                    record(diff.mode_changed, rel_path)
+        except _FirstDifference:
+            pass
+    return diff
+
+
+def sync_project(src: Path, dest: Path, exclude, engine: CopyEngine = None,
+                 diff: TreeDiff = None, keep=None) -> SyncStats:
+    """
+    Incrementally sync src into dest, like rsync.
+    Only new or changed files are copied and files missing from src are removed,
+    unchanged files keep their inodes. A file counts as unchanged when its size
+    and mtime match. Excluded paths still in dest are removed too, apart from what
+    keep matches, the files din writes into an install itself.
+    A diff of dest against src from compare_trees can be passed to skip the scan.
+    """
+    matcher = ExcludeMatcher.of(exclude)
+    stats = SyncStats(engine=engine or CopyEngine())
+
+    dest.mkdir(parents=True, exist_ok=True)
+    if diff is None:
+        diff = compare_trees(dest, src, matcher, quick=True, keep=ExcludeMatcher.of(keep))
 
-    def walk(base):
-        for root, dirs, files in os.walk(base):
-            root_path = Path(root)
+    for rel_path in diff.removed:
+        _remove_path(os.path.join(dest, rel_path))
+        stats.files_removed += 1
 
-            if ignore:
-                ignored = ignore(str(root_path), dirs + files)
-                dirs[:] = [d for d in dirs if d not in ignored]
-                files = [f for f in files if f not in ignored]
+    copied = diff.added + diff.modified
+    for rel_path in diff.mode_changed:
+        target = os.path.join(dest, rel_path)
+        if os.stat(target).st_nlink > 1:
+            # a passed diff may come from the active version, which a seeded dest shares
+            # its inodes with, chmod would change that version too
+            copied.append(rel_path)
+        else:
+            os.chmod(target, os.stat(os.path.join(src, rel_path)).st_mode)
 
-            yield root_path, dirs, files
+    for rel_path in copied:
+        target = os.path.join(dest, rel_path)
+        # unlink rather than overwrite so the old inode is never written through
+        _remove_path(target)
+        _copy_entry(os.path.join(src, rel_path), target, rel_path, matcher, stats)
 
-    # First pass: check dir1 against dir2
-    for root1, dirs1, files1 in walk(dir1):
-        rel_root = root1.relative_to(dir1)
-        root2 = dir2 / rel_root
+    return stats
 
-        # Directory missing
-        if not root2.exists():
-            return True
 
-        # Compare files
-        for name in files1:
-            file1 = root1 / name
-            file2 = root2 / name
+def sync_paths(src: Path, dest: Path, rel_paths, exclude, engine: CopyEngine = None) -> SyncStats:
+    """
+    Syncs only rel_paths from src into dest, for callers that already know what changed,
+    like din --watch. A path missing from src is removed from dest, a directory is synced
+    recursively. Each file is written under a temporary name and renamed over its target,
+    so dest never holds a half written file and inodes shared with other versions are
+    never written through. Unchanged files are skipped like sync_project does, excluded
+    paths are left alone on both sides. An empty path stands for the whole tree.
+    """
+    matcher = ExcludeMatcher.of(exclude)
+    stats = SyncStats(engine=engine or CopyEngine())
+    synced_dirs = set()
+    if "" in rel_paths:
+        rel_paths = [""]
+
+    for rel_path in sorted(set(rel_paths)):
+        parts = rel_path.split("/")
+        # a directory that was synced already covers everything under it
+        if any("/".join(parts[:i]) in synced_dirs for i in range(1, len(parts))):
+            continue
+        if _sync_path(str(src), str(dest), rel_path, matcher, stats):
+            synced_dirs.add(rel_path)
+    return stats
+
+
+def _sync_path(src: str, dest: str, rel_path: str, matcher: ExcludeMatcher,
+               stats: SyncStats) -> bool:
+    """
+    Syncs one path, returns True if it was a directory.
+    """
+    src_path = os.path.join(src, rel_path)
+    target = os.path.join(dest, rel_path)
+    exists = os.path.lexists(src_path)
+    # a deleted path is checked as what it still is in dest, for directory only patterns
+    is_dir = os.path.isdir(src_path if exists else target) and not os.path.islink(
+        src_path if exists else target)
+    if matcher and matcher.excludes(rel_path, is_dir):
+        return False
+
+    if not exists:
+        if os.path.lexists(target):
+            _remove_path(target)
+            stats.files_removed += 1
+        return False
 
-            if not file2.exists():
-                return True
+    parent = rel_path.rpartition("/")[0]
+    if parent and not os.path.isdir(os.path.join(dest, parent)):
+        # a new parent directory brings everything under it along, this path included
+        return _sync_path(src, dest, parent, matcher, stats)
+
+    if is_dir and os.path.isdir(target) and not os.path.islink(target):
+        prefix = f"{rel_path}/" if rel_path else ""
+        for name in set(os.listdir(src_path)) | set(os.listdir(target)):
+            _sync_path(src, dest, prefix + name, matcher, stats)
+        return True
+
+    if not is_dir and _same_entry(src_path, target):
+        return False
+
+    tmp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{os.getpid()}.dintmp")
+    _remove_path(tmp)
+    try:
+        _copy_entry(src_path, tmp, rel_path, matcher, stats)
+    except FileNotFoundError:
+        # deleted while being copied, the event for that will sync it again
+        _remove_path(tmp)
+        return False
+    if os.path.isdir(target) and not os.path.islink(target):
+        _remove_path(target)
+    elif is_dir and os.path.lexists(target):
+        os.unlink(target)
+    os.replace(tmp, target)
+    return is_dir
 
-            if files_differ(file1, file2):
-                return True
 
-        # Check for extra files in dir2 at this level
-        names2 = set(
-            f.name for f in root2.iterdir()
-            if f.is_file()
-        )
-        if ignore:
-            ignored = ignore(str(root2), list(names2))
-            names2 -= set(ignored)
+def _same_entry(src_path: str, target: str) -> bool:
+    try:
+        target_stat = os.lstat(target)
+    except FileNotFoundError:
+        return False
+    if os.path.islink(src_path):
+        return os.path.islink(target) and os.readlink(src_path) == os.readlink(target)
+    src_stat = os.lstat(src_path)
+    return (stat.S_ISREG(target_stat.st_mode)
+            and target_stat.st_size == src_stat.st_size
+            and target_stat.st_mtime_ns == src_stat.st_mtime_ns
+            and target_stat.st_mode == src_stat.st_mode)
 
-        if set(files1) != names2:
-            return True
 
-    # Second pass: detect extra directories/files in dir2
-    for root2, _, _ in walk(dir2):
-        rel_root = root2.relative_to(dir2)
-        if not (dir1 / rel_root).exists():
-            return True
+def _remove_path(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
 
-    return False
 
+def _copy_entry(src_path: str, target: str, rel_path: str, matcher: ExcludeMatcher,
+                stats: SyncStats) -> None:
+    if os.path.islink(src_path):
+        os.symlink(os.readlink(src_path), target)
+        stats.files_copied += 1
+        return
 
-def remove_excluded(root_path: Path, excluded: list[str]):
+    if os.path.isdir(src_path):
+        os.mkdir(target)
+        with os.scandir(src_path) as it:
+            for entry in it:
+                child_rel = f"{rel_path}/{entry.name}"
+                if matcher and matcher.matches(child_rel, entry.is_dir(follow_symlinks=False)):
+                    continue
+                _copy_entry(entry.path, os.path.join(target, entry.name), child_rel,
+                            matcher, stats)
+        shutil.copystat(src_path, target)
+        return
+
+    stats.engine.copy_file(src_path, target)
+    stats.files_copied += 1
+    stats.bytes_copied += os.stat(target).st_size
+
+
+def directories_differ(dir1: Path, dir2: Path, ignore_patterns=None) -> bool:
+    """
+    Return True if directories differ, False if identical.
+    Stops at first detected difference.
+    """
+    return bool(compare_trees(dir1, dir2, ignore_patterns, stop_at_first=True))
+
+
+def remove_excluded(root_path: Path, excluded, keep=None):
     """
     Removes files and directories under root_path that match
-    any of the glob patterns in `excluded`.
-    """
-    # Create the ignore callable (same style as copytree)
-    # determine_to_remove is a function which takes a path to a directory
-    # and file name sand returns all the files in that list which need to be removed
-    determine_to_remove = shutil.ignore_patterns(*excluded)
-
-    # Walk bottom-up so directories can be removed safely
-    for current_root, dirs, files in os.walk(root_path, topdown=False):
-        current_root_path = Path(current_root)
-
-        # Get names that should be removed
-        names = dirs + files
-        to_remove = determine_to_remove(current_root, names)
-
-        for name in to_remove:
-            path = current_root_path / name
-            if path.is_dir():
-                shutil.rmtree(path)
-            elif path.exists():
-                path.unlink()
+    any of the patterns in `excluded`, a list of patterns or an ExcludeMatcher.
+    Anything matched by `keep` is left alone and not descended into.
+    """
+    matcher = ExcludeMatcher.of(excluded)
+    keep = ExcludeMatcher.of(keep)
+    if not matcher:
+        return
+
+    # Walk top-down so removed directories are never descended into
+    for current_root, dirs, files in os.walk(root_path):
+        rel = Path(current_root).relative_to(root_path).as_posix()
+        prefix = "" if rel == "." else rel + "/"
+
+        for name in files:
+            if matcher.matches(prefix + name) and not (keep and keep.matches(prefix + name)):
+                os.unlink(os.path.join(current_root, name))
+
+        kept = []
+        for name in dirs:
+            path = os.path.join(current_root, name)
+            if keep and keep.matches(prefix + name, is_dir=True):
+                continue
+            if matcher.matches(prefix + name, is_dir=True):
+                if os.path.islink(path):
+                    os.unlink(path)
+                else:
+                    shutil.rmtree(path)
+            else:
+                kept.append(name)
+        dirs[:] = kept
+
+
+def remove_excluded_paths(root_path: Path, rel_paths: list[str], excluded, keep=None) -> int:
+    """
+    Like remove_excluded but only looks at rel_paths, like the files an update touched,
+    so the cost follows the number of paths instead of the size of the tree.
+    A path inside an excluded directory removes that whole directory.
+    Returns how many files or directories were removed.
+    """
+    matcher = ExcludeMatcher.of(excluded)
+    keep = ExcludeMatcher.of(keep)
+    if not matcher:
+        return 0
+
+    removed = 0
+    for rel_path in rel_paths:
+        parts = rel_path.split("/")
+        # the shallowest excluded ancestor, or the path itself
+        for i in range(1, len(parts) + 1):
+            target = "/".join(parts[:i])
+            is_dir = i < len(parts)
+            if keep and keep.matches(target, is_dir):
+                break
+            if matcher.matches(target, is_dir):
+                path = os.path.join(root_path, target)
+                if os.path.lexists(path):
+                    _remove_path(path)
+                    removed += 1
+                break
+    return removed
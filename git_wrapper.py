@@ -1,8 +1,26 @@
+import hashlib
+import os
 import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
+from timing_utils import phase, GIT
+
+
+def sparse_checkout_patterns(excluded: list[str]) -> list[str]:
+    """
+    Turns exclude patterns into sparse checkout patterns that select everything but them.
+    Both use gitignore syntax, so each exclude is negated and each negation un-negated.
+    """
+    patterns = ["/*"]
+    for pattern in excluded:
+        if not pattern:
+            continue
+        patterns.append(pattern[1:] if pattern.startswith("!") else "!" + pattern)
+    return patterns
 
 
 @dataclass
@@ -10,11 +28,20 @@ class GitResult:
     success: bool
     failureMessage: Optional[str] = None
     realMessage: Optional[str] = None
+    # set by updateRepoAtPath, HEAD before and after the update
+    old_revision: Optional[str] = None
+    new_revision: Optional[str] = None
 
 
 class GitWrapper:
     def __init__(self, default_domain: str = "github.com"):
         self.default_domain = default_domain
+        # remote url -> {branch: sha} from ls-remote, shared by every repo using that remote
+        self._remote_heads: dict[str, dict[str, str]] = {}
+        self._remote_heads_lock = threading.Lock()
+        # mirrors fetched by this process, so concurrent updates sharing one fetch it once
+        self._synced_mirrors: set[Path] = set()
+        self._mirror_locks: dict[Path, threading.Lock] = {}
 
     # -------------------------
     # Public API
@@ -23,7 +50,14 @@ class GitWrapper:
     def is_git_installed(self) -> bool:
         return shutil.which("git") is not None
 
-    def cloneTo(self, url: str, path: str) -> GitResult:
+    def cloneTo(self, url: str, path: str, reference: Optional[Path] = None,
+                sparse: bool = False) -> GitResult:
+        """
+        With sparse nothing is checked out and, unless objects come from reference,
+        only commits and trees are fetched. Call checkout once the paths to leave out
+        are known, it fetches just the blobs it writes. Servers that don't support
+        filters send everything instead, the clone still works.
+        """
         if not self.is_git_installed():
             return GitResult(
                 success=False,
@@ -39,16 +73,32 @@ class GitWrapper:
                 failureMessage="Destination path already exists and is not empty.",
             )
 
-        # Shallow clone
-        result = self._run_git(
-            ["clone", "--depth", "1", resolved_url, str(path_obj)])
+        if reference is not None:
+            # objects already in the mirror are borrowed through alternates instead of fetched,
+            # so the history costs nothing and the clone isn't made shallow
+            args = ["clone", "--reference", str(reference)]
+        else:
+            # Shallow clone
+            args = ["clone", "--depth", "1"]
+            if sparse:
+                args.append("--filter=blob:none")
+        if sparse:
+            args.append("--no-checkout")
+
+        result = self._run_git(args + [resolved_url, str(path_obj)])
 
         if result.returncode == 0:
             return GitResult(success=True)
 
         return self._handle_git_error(result)
 
-    def updateRepoAtPath(self, path: Path) -> GitResult:
+    def updateRepoAtPath(self, path: Path, shallow: bool = True,
+                         keep: tuple[str, ...] = ()) -> GitResult:
+        """
+        Moves the work tree at path to the remote's head. Untracked files are cleaned
+        up apart from the ones matching the gitignore patterns in keep, like the
+        bytecode and metadata din adds to an install.
+        """
 
         if not self.is_git_installed():
             return GitResult(
@@ -68,20 +118,31 @@ class GitWrapper:
                 failureMessage="Specified path is not a git repository.",
             )
 
-        branch_proc = self._run_git(
-            ["rev-parse", "--abbrev-ref", "HEAD"],
-            cwd=str(path),
-        )
+        head = self._read_head(path)
+        if head is not None:
+            branch = head[0]
+            # fast path: skip the fetch entirely when the remote hasn't moved
+            if self.is_up_to_date(path):
+                return GitResult(
+                    success=False,
+                    failureMessage="Repository is already up to date.",
+                    realMessage=None,
+                )
+        else:
+            branch_proc = self._run_git(
+                ["rev-parse", "--abbrev-ref", "HEAD"],
+                cwd=str(path),
+            )
 
-        if branch_proc.returncode != 0:
-            return self._handle_git_error(branch_proc)
+            if branch_proc.returncode != 0:
+                return self._handle_git_error(branch_proc)
 
-        branch = branch_proc.stdout.strip()
+            branch = branch_proc.stdout.strip()
 
-        fetch_proc = self._run_git(
-            ["fetch", "origin", branch, "--depth", "1"],
-            cwd=str(path),
-        )
+        fetch_args = ["fetch", "origin", branch]
+        if shallow:
+            fetch_args += ["--depth", "1"]
+        fetch_proc = self._run_git(fetch_args, cwd=str(path))
 
         if fetch_proc.returncode != 0:
             return self._handle_git_error(fetch_proc)
@@ -109,8 +170,18 @@ class GitWrapper:
                 realMessage=None,
             )
 
+        # only paths that differ between the two commits are written, unlike reset --hard
+        # files din removed as excluded stay removed when the update didn't touch them
+        read_tree_proc = self._run_git(
+            ["read-tree", "--reset", "-u", "HEAD", f"origin/{branch}"],
+            cwd=str(path),
+        )
+
+        if read_tree_proc.returncode != 0:
+            return self._handle_git_error(read_tree_proc)
+
         reset_proc = self._run_git(
-            ["reset", "--hard", f"origin/{branch}"],
+            ["reset", "--soft", f"origin/{branch}"],
             cwd=str(path),
         )
 
@@ -118,37 +189,323 @@ class GitWrapper:
             return self._handle_git_error(reset_proc)
 
         clean_proc = self._run_git(
-            ["clean", "-fd"],
+            ["clean", "-fd", *(arg for pattern in keep for arg in ("-e", pattern))],
             cwd=str(path),
         )
 
         if clean_proc.returncode != 0:
             return self._handle_git_error(clean_proc)
 
-        gc_proc = self._run_git(
-            ["gc", "--prune=now", "--aggressive"],
+        # repacking is left to run_maintenance so updates return as soon as the tree matches
+        return GitResult(success=True, old_revision=local_rev.stdout.strip(),
+                         new_revision=remote_rev.stdout.strip())
+
+    def checkout(self, path: Path, sparse_patterns: Optional[list[str]] = None) -> GitResult:
+        """
+        Fills the work tree of a clone made with sparse=True. With sparse_patterns only
+        the paths they select are fetched and written, see sparse_checkout_patterns.
+        Can be called again on a checked out repo to apply new patterns.
+        """
+        if sparse_patterns is not None:
+            result = self.set_sparse_patterns(path, sparse_patterns)
+            if not result.success:
+                return result
+
+        proc = self._run_git(["read-tree", "-mu", "HEAD"], cwd=str(path))
+        if proc.returncode != 0:
+            return self._handle_git_error(proc)
+        return GitResult(success=True)
+
+    def set_sparse_patterns(self, path: Path, patterns: list[str]) -> GitResult:
+        proc = self._run_git(["config", "core.sparseCheckout", "true"], cwd=str(path))
+        if proc.returncode != 0:
+            return self._handle_git_error(proc)
+
+        info_dir = path / ".git" / "info"
+        info_dir.mkdir(parents=True, exist_ok=True)
+        (info_dir / "sparse-checkout").write_text("\n".join(patterns) + "\n")
+        return GitResult(success=True)
+
+    def sparse_patterns(self, path: Path) -> Optional[list[str]]:
+        """
+        The sparse checkout patterns of the repo at path, None if it isn't sparse.
+        """
+        try:
+            return (path / ".git" / "info" / "sparse-checkout").read_text().splitlines()
+        except OSError:
+            return None
+
+    def restore_work_tree(self, path: Path) -> GitResult:
+        """
+        Writes back every tracked file missing from the work tree, like the ones removed as excluded.
+        """
+        proc = self._run_git(["reset", "--hard", "HEAD"], cwd=str(path))
+        if proc.returncode != 0:
+            return self._handle_git_error(proc)
+        return GitResult(success=True)
+
+    def changed_paths(self, path: Path, old_revision: str,
+                      new_revision: str) -> Optional[list[str]]:
+        """
+        Paths added, modified or changed in type, like a file turned into a symlink,
+        between two revisions, from their trees alone so partial clones don't fetch
+        any blobs. None if git couldn't diff them.
+        """
+        proc = self._run_git(
+            ["diff", "--name-only", "--no-renames", "--diff-filter=AMT", "-z",
+             old_revision, new_revision],
             cwd=str(path),
         )
+        if proc.returncode != 0:
+            return None
+        return [p for p in proc.stdout.split("\0") if p]
+
+    def read_file(self, path: Path, file: str, revision: str = "HEAD") -> Optional[str]:
+        """
+        Reads a file as of revision straight from the object database,
+        it doesn't need to be checked out.
+        """
+        proc = self._run_git(["show", f"{revision}:{file}"], cwd=str(path))
+        if proc.returncode != 0:
+            return None
+        return proc.stdout
+
+    def mirror_path(self, url: str, mirror_dir: Path) -> Path:
+        """
+        Where the bare mirror of url lives, keyed by the resolved url so
+        owner/repo and its full https url share one mirror.
+        """
+        resolved_url = self._resolve_url(url)
+        return mirror_dir / f"{hashlib.sha256(resolved_url.encode()).hexdigest()[:16]}.git"
+
+    def update_mirror(self, url: str, mirror_dir: Path) -> GitResult:
+        """
+        Creates or fetches the bare mirror of url, at most once per GitWrapper.
+        Installs cloned with the mirror as reference read objects from it through
+        alternates, so objects are never pruned from a mirror.
+        """
+        mirror = self.mirror_path(url, mirror_dir)
+        with self._remote_heads_lock:
+            lock = self._mirror_locks.setdefault(mirror, threading.Lock())
+
+        with lock:
+            if mirror in self._synced_mirrors:
+                return GitResult(success=True)
+
+            if mirror.exists():
+                proc = self._run_git(["fetch", "--quiet", "--no-prune", "origin"], cwd=str(mirror))
+                if proc.returncode != 0:
+                    return self._handle_git_error(proc)
+            else:
+                result = self._create_mirror(self._resolve_url(url), mirror)
+                if not result.success:
+                    return result
+
+            self._synced_mirrors.add(mirror)
+        return GitResult(success=True)
+
+    def _create_mirror(self, resolved_url: str, mirror: Path) -> GitResult:
+        mirror.parent.mkdir(parents=True, exist_ok=True)
+        # cloned next to its final path and renamed in, so a failed clone never looks like a mirror
+        tmp = mirror.with_name(f".{mirror.name}.{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        proc = self._run_git(["clone", "--mirror", "--quiet", resolved_url, str(tmp)])
+        if proc.returncode != 0:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return self._handle_git_error(proc)
+
+        # installs depend on the mirror's objects, even ones no ref reaches anymore
+        for key, value in (("gc.auto", "0"), ("gc.pruneExpire", "never"), ("fetch.prune", "false")):
+            self._run_git(["config", key, value], cwd=str(tmp))
+
+        try:
+            os.rename(tmp, mirror)
+        except OSError:
+            # another din created it first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return GitResult(success=True)
+
+    def object_counts(self, path: Path) -> tuple[int, int]:
+        """
+        Returns (loose objects, packs) for the repo at path by listing .git/objects,
+        without spawning git.
+        """
+        objects_dir = path / ".git" / "objects"
+        loose = 0
+        packs = 0
+        try:
+            for entry in objects_dir.iterdir():
+                name = entry.name
+                if len(name) == 2 and entry.is_dir():
+                    loose += sum(1 for _ in entry.iterdir())
+                elif name == "pack":
+                    packs += sum(1 for p in entry.iterdir() if p.suffix == ".pack")
+        except OSError:
+            pass
+        return loose, packs
+
+    def needs_maintenance(self, path: Path, max_loose: int, max_packs: int) -> bool:
+        loose, packs = self.object_counts(path)
+        return loose > max_loose or packs > max_packs
+
+    def run_maintenance(self, path: Path, aggressive: bool = False) -> GitResult:
+        if not (path / ".git").exists():
+            return GitResult(
+                success=False,
+                failureMessage="Specified path is not a git repository.",
+            )
+
+        args = ["gc", "--prune=now"]
+        if aggressive:
+            args.append("--aggressive")
+
+        gc_proc = self._run_git(args, cwd=str(path))
 
         if gc_proc.returncode != 0:
             return self._handle_git_error(gc_proc)
 
         return GitResult(success=True)
 
+    def head_revision(self, path: Path) -> Optional[str]:
+        """
+        Returns the sha HEAD points at, read from .git without spawning git.
+        """
+        head = self._read_head(path)
+        return head[1] if head else None
+
+    def resolve_url(self, url: str) -> str:
+        return self._resolve_url(url)
+
+    def is_up_to_date(self, path: Path) -> Optional[bool]:
+        """
+        Compares the local HEAD with the remote branch without fetching.
+        Returns None when that can't be determined cheaply.
+        """
+        head = self._read_head(path)
+        url = self._read_remote_url(path)
+        if head is None or url is None:
+            return None
+
+        branch, local_head = head
+        remote = self.remote_head(url, branch)
+        if remote is None:
+            return None
+        return remote == local_head
+
+    def probe_remotes(self, paths: list[Path], jobs: int = 4) -> None:
+        """
+        Looks up the remote heads for every repo in paths ahead of updating them.
+        Repos sharing a remote are batched into one ls-remote covering all their branches,
+        the results are cached and used by updateRepoAtPath's fast path.
+        """
+        wanted: dict[str, set[str]] = {}
+        for path in paths:
+            head = self._read_head(path)
+            url = self._read_remote_url(path)
+            if head is None or url is None:
+                continue
+            wanted.setdefault(url, set()).add(head[0])
+
+        if not wanted:
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            for url, branches in wanted.items():
+                pool.submit(self._ls_remote, url, sorted(branches))
+
+    def remote_head(self, url: str, branch: str) -> Optional[str]:
+        """
+        Returns the sha the remote's branch points at or None if it couldn't be determined.
+        """
+        with self._remote_heads_lock:
+            cached = self._remote_heads.get(url, {})
+            if branch in cached:
+                return cached[branch]
+
+        return self._ls_remote(url, [branch]).get(branch)
+
+    def _ls_remote(self, url: str, branches: list[str]) -> dict[str, str]:
+        proc = self._run_git(
+            ["ls-remote", url] + [f"refs/heads/{b}" for b in branches])
+
+        heads = {}
+        if proc.returncode == 0:
+            for line in proc.stdout.splitlines():
+                sha, _, ref = line.partition("\t")
+                heads[ref.removeprefix("refs/heads/")] = sha
+
+        with self._remote_heads_lock:
+            self._remote_heads.setdefault(url, {}).update(heads)
+        return heads
+
+    def _read_head(self, path: Path) -> Optional[tuple[str, str]]:
+        """
+        Reads (branch, sha) for HEAD straight from .git without spawning git.
+        Returns None for detached heads or layouts it doesn't understand.
+        """
+        git_dir = path / ".git"
+        try:
+            head = (git_dir / "HEAD").read_text().strip()
+        except OSError:
+            return None
+
+        if not head.startswith("ref: refs/heads/"):
+            return None
+
+        ref = head.removeprefix("ref: ")
+        branch = ref.removeprefix("refs/heads/")
+
+        try:
+            return branch, (git_dir / ref).read_text().strip()
+        except OSError:
+            pass
+
+        try:
+            packed = (git_dir / "packed-refs").read_text()
+        except OSError:
+            return None
+
+        for line in packed.splitlines():
+            if line.startswith(("#", "^")):
+                continue
+            sha, _, name = line.partition(" ")
+            if name == ref:
+                return branch, sha
+        return None
+
+    def _read_remote_url(self, path: Path, remote: str = "origin") -> Optional[str]:
+        try:
+            config = (path / ".git" / "config").read_text()
+        except OSError:
+            return None
+
+        in_remote = False
+        for line in config.splitlines():
+            line = line.strip()
+            if line.startswith("["):
+                in_remote = line == f'[remote "{remote}"]'
+            elif in_remote and line.startswith("url"):
+                key, _, value = line.partition("=")
+                if key.strip() == "url":
+                    return value.strip()
+        return None
+
     def _resolve_url(self, url: str) -> str:
-        if url.startswith(("http://", "https://", "git://", "ssh://")):
+        if url.startswith(("http://", "https://", "git://", "ssh://", "file://")):
             return url
         if "/" in url:
             return f"https://{self.default_domain}/{url}"
         return f"https://{self.default_domain}/{url}"
 
     def _run_git(self, args, cwd: Optional[str] = None):
-        return subprocess.run(
-            ["git"] + args,
-            cwd=cwd,
-            capture_output=True,
-            text=True,
-        )
+        with phase(f"git {args[0]}", GIT):
+            return subprocess.run(
+                ["git"] + args,
+                cwd=cwd,
+                capture_output=True,
+                text=True,
+            )
 
     def _handle_git_error(self, process: subprocess.CompletedProcess) -> GitResult:
         real_message = (process.stderr or process.stdout or "").strip()
@@ -0,0 +1,174 @@
+import errno
+import os
+import shutil
+from pathlib import Path
+from constants import DEFAULT_INSTALL_ROOT, KEEP_VERSIONS
+
+VERSIONS_DIR_NAME = ".versions"
+STAGE_PREFIX = ".stage-"
+
+
+def installed_names(root: Path = DEFAULT_INSTALL_ROOT) -> list[str]:
+    if not root.exists():
+        return []
+
+    # dot directories under the install root are din's own bookkeeping
+    return sorted(
+        entry.name for entry in root.iterdir()
+        if entry.is_dir() and not entry.name.startswith(".")
+    )
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _seed_file(src: str, dst: str) -> None:
+    """
+    Hardlinks a file from the active version into a staged one. git rewrites some of
+    its metadata in place, so everything in .git but the immutable objects is copied.
+    """
+    parts = Path(src).parts
+    if ".git" in parts and "objects" not in parts[parts.index(".git"):]:
+        shutil.copy2(src, dst)
+    else:
+        os.link(src, dst)
+
+
+# an install at root/<name> is a symlink to root/.versions/<name>/<id>.
+# new versions are built in a staging directory, seeded with hardlinks to the active one,
+# and activated by atomically replacing the symlink, so users never see a half copied tree
+# and rolling back is just pointing the symlink at an older version.
+class VersionedInstall:
+    def __init__(self, name: str, root: Path = DEFAULT_INSTALL_ROOT, keep: int = KEEP_VERSIONS):
+        self.name = name
+        self.link = root / name
+        self.versions_dir = root / VERSIONS_DIR_NAME / name
+        self.keep = max(1, keep)
+
+    def versions(self) -> list[Path]:
+        if not self.versions_dir.exists():
+            return []
+        return sorted(
+            (p for p in self.versions_dir.iterdir() if p.name.isdigit()),
+            key=lambda p: int(p.name),
+        )
+
+    def current(self) -> Path | None:
+        if not self.link.is_symlink():
+            return None
+        return self.versions_dir / Path(os.readlink(self.link)).name
+
+    def _next_id(self) -> str:
+        versions = self.versions()
+        last = int(versions[-1].name) if versions else 0
+        return f"{last + 1:06d}"
+
+    def migrate_legacy(self) -> None:
+        """
+        Installs made before versioning are plain directories, move them in as the first version.
+        """
+        if self.link.is_symlink() or not self.link.is_dir():
+            return
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        version = self.versions_dir / self._next_id()
+        os.rename(self.link, version)
+        self._point_to(version)
+
+    def stage(self, seed: bool = True) -> Path:
+        """
+        Creates a staging directory for the next version. With seed it starts as a
+        hardlinked copy of the active version, so unchanged files cost nothing.
+        """
+        staging = self._prepare_staging()
+        current = self.current()
+        if seed and current is not None and current.exists():
+            shutil.copytree(current, staging, symlinks=True, copy_function=_seed_file)
+        else:
+            staging.mkdir()
+        return staging
+
+    def stage_from(self, tree: Path) -> Path:
+        """
+        Moves a tree built elsewhere on the install root's filesystem, like a fresh clone,
+        in as the staging directory. Nothing is copied, it is a rename.
+        """
+        staging = self._prepare_staging()
+        os.rename(tree, staging)
+        return staging
+
+    def _prepare_staging(self) -> Path:
+        self.migrate_legacy()
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+
+        # left behind by an interrupted install or update. A stage whose process is
+        # still running belongs to a concurrent one, like --watch next to a cron --update-all
+        for leftover in self.versions_dir.glob(f"{STAGE_PREFIX}*"):
+            pid = leftover.name[len(STAGE_PREFIX):]
+            if pid.isdigit() and int(pid) != os.getpid() and _pid_alive(int(pid)):
+                continue
+            shutil.rmtree(leftover, ignore_errors=True)
+
+        return self.versions_dir / f"{STAGE_PREFIX}{os.getpid()}"
+
+    def activate(self, staging: Path) -> Path:
+        """
+        Turns staging into the active version, then prunes versions past the keep limit.
+        """
+        while True:
+            version = self.versions_dir / self._next_id()
+            try:
+                os.rename(staging, version)
+                break
+            except OSError as e:
+                # a concurrent update took the id first
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        self._point_to(version)
+        self.prune()
+        return version
+
+    def discard(self, staging: Path) -> None:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def rollback(self) -> Path | None:
+        """
+        Points the install at the version before the active one, returns it or None
+        if there is no older version. Newer versions are kept so the rollback can be undone.
+        """
+        current = self.current()
+        older = [v for v in self.versions() if current is None or int(v.name) < int(current.name)]
+        if not older:
+            return None
+        self._point_to(older[-1])
+        return older[-1]
+
+    def prune(self) -> None:
+        current = self.current()
+        versions = self.versions()
+        for version in versions[:-self.keep]:
+            if version != current:
+                shutil.rmtree(version, ignore_errors=True)
+
+    def remove(self) -> None:
+        if self.link.is_symlink():
+            self.link.unlink()
+        elif self.link.is_dir():
+            shutil.rmtree(self.link)
+        if self.versions_dir.exists():
+            shutil.rmtree(self.versions_dir)
+        versions_root = self.versions_dir.parent
+        if versions_root.exists() and not any(versions_root.iterdir()):
+            versions_root.rmdir()
+
+    def _point_to(self, version: Path) -> None:
+        tmp_link = self.link.with_name(f".{self.name}.{os.getpid()}.dumb_swap")
+        tmp_link.unlink(missing_ok=True)
+        os.symlink(os.path.relpath(version, self.link.parent), tmp_link)
+        os.replace(tmp_link, self.link)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import stat
+from pathlib import Path
+from typing import Self
+from constants import MANIFEST_FILE
+from content_utils import PARALLEL_MIN_SIZE, ParallelContents
+from exclude_matcher import ExcludeMatcher
+
+MANIFEST_VERSION = 1
+
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def walk_files(root: Path, exclude, start: str = ""):
+    """
+    Yields (relative_path, DirEntry) for every non directory entry under root,
+    or under the directory start relative to it, skipping anything matched by
+    exclude, excluded directories are never descended into.
+    """
+    matcher = ExcludeMatcher.of(exclude)
+    stack = [(os.path.join(root, start), f"{start}/")] if start else [(str(root), "")]
+    while stack:
+        current, rel = stack.pop()
+        with os.scandir(current) as it:
+            entries = list(it)
+        for entry in entries:
+            rel_path = f"{rel}{entry.name}"
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if matcher and matcher.matches(rel_path, is_dir):
+                continue
+            if is_dir:
+                stack.append((entry.path, f"{rel_path}/"))
+            else:
+                yield rel_path, entry
+
+
+def _entry_hash(entry: os.DirEntry) -> str:
+    if entry.is_symlink():
+        return "link:" + os.readlink(entry.path)
+    return hash_file(entry.path)
+
+
+def _path_hash(path: str, st: os.stat_result) -> str:
+    if stat.S_ISLNK(st.st_mode):
+        return "link:" + os.readlink(path)
+    return hash_file(path)
+
+
+# a manifest is stored as a json file at project_root/MANIFEST_FILE and records
+# size, mtime_ns, mode and a sha256 for every installed file, keyed by relative path
+class Manifest:
+    def __init__(self, files: dict[str, list] = None, exclude=None):
+        self.files = files if files is not None else {}
+        # pattern order matters once negations are involved
+        self.exclude = ExcludeMatcher.of(exclude).patterns
+
+    @staticmethod
+    def build(root: Path, exclude, previous: "Manifest" = None) -> "Manifest":
+        """
+        Scans root and builds a manifest for it. Hashes from previous are reused for
+        files whose stat has not changed, so only new or modified files are read.
+        Big files are hashed on a thread pool while the scan goes on.
+        """
+        files = {}
+        old = previous.files if previous else {}
+        with ParallelContents() as parallel:
+            pending = []
+            for rel_path, entry in walk_files(root, exclude):
+                st = entry.stat(follow_symlinks=False)
+                record = old.get(rel_path)
+                if record and record[:3] == [st.st_size, st.st_mtime_ns, st.st_mode]:
+                    digest = record[3]
+                elif st.st_size >= PARALLEL_MIN_SIZE and not entry.is_symlink():
+                    digest = None
+                    pending.append((rel_path, parallel.submit(hash_file, entry.path)))
+                else:
+                    digest = _entry_hash(entry)
+                files[rel_path] = [st.st_size, st.st_mtime_ns, st.st_mode, digest]
+            for rel_path, future in pending:
+                files[rel_path][3] = future.result()
+        return Manifest(files, exclude)
+
+    def update_paths(self, root: Path, rel_paths, exclude) -> Self:
+        """
+        Rescans only rel_paths and whatever is under them, for callers that know what
+        changed, the records of every other file are kept as they are.
+        """
+        matcher = ExcludeMatcher.of(exclude)
+        scanned_dirs = set()
+        for start in sorted(set(rel_paths)):
+            parts = start.split("/")
+            if any("/".join(parts[:i]) in scanned_dirs for i in range(1, len(parts))):
+                continue
+            # a path that wasn't a file may have been a directory, drop what was under it
+            if self.files.pop(start, None) is None:
+                prefix = start + "/"
+                for rel_path in [r for r in self.files if r.startswith(prefix)]:
+                    del self.files[rel_path]
+
+            path = os.path.join(root, start)
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            is_dir = stat.S_ISDIR(st.st_mode)
+            if matcher and matcher.excludes(start, is_dir):
+                continue
+            if not is_dir:
+                self.files[start] = [st.st_size, st.st_mtime_ns, st.st_mode, _path_hash(path, st)]
+                continue
+            scanned_dirs.add(start)
+            for rel_path, entry in walk_files(root, matcher, start):
+                entry_stat = entry.stat(follow_symlinks=False)
+                self.files[rel_path] = [entry_stat.st_size, entry_stat.st_mtime_ns,
+                                        entry_stat.st_mode, _entry_hash(entry)]
+        return self
+
+    @staticmethod
+    def load(project_root: Path) -> Self | None:
+        """
+        Returns the manifest stored in project_root or None if it is missing or unreadable.
+        """
+        manifest_path = project_root / MANIFEST_FILE
+        try:
+            with manifest_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return Manifest(data.get("files", {}), data.get("exclude", []))
+
+    def write(self, project_root: Path) -> Self:
+        manifest_path = project_root / MANIFEST_FILE
+        data = {
+            "version": MANIFEST_VERSION,
+            "exclude": self.exclude,
+            "files": self.files,
+        }
+        tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, manifest_path)
+        return self
+
+    def is_stale_for(self, exclude) -> bool:
+        """
+        A manifest built with different exclude patterns can't be trusted.
+        """
+        return self.exclude != ExcludeMatcher.of(exclude).patterns
+
+    def tree_differs(self, root: Path) -> bool:
+        """
+        Returns True if the tree at root doesn't match the manifest.
+        Only stat is used for files whose size, mtime and mode match,
+        files whose stat changed are hashed to check if their content did.
+        """
+        seen = 0
+        for rel_path, entry in walk_files(root, self.exclude):
+            record = self.files.get(rel_path)
+            if record is None:
+                return True
+            seen += 1
+
+            st = entry.stat(follow_symlinks=False)
+            if st.st_size != record[0] or st.st_mode != record[2]:
+                return True
+            if st.st_mtime_ns == record[1]:
+                continue
+            if _entry_hash(entry) != record[3]:
+                return True
+
+        return seen != len(self.files)
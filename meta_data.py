@@ -1,30 +1,57 @@
 import json
+import os
 from pathlib import Path
-from constants import METADATA_FILE
+from constants import METADATA_FILE, DEFAULT_INSTALL_ROOT
 from typing import Self
+from manifest import Manifest
+from registry import Registry
 
 
-# meta data is stored as a json file at project_root/METADATA_FILE
+# meta data is kept in the registry, the index of every install, and in a json file at
+# project_root/METADATA_FILE that travels with each version. Readers go through load,
+# the file is only read for installs the registry doesn't describe yet
 class MetaData:
-    def __init__(self, is_git_install: bool = False, source_path: Path = None):
+    def __init__(self, is_git_install: bool = False, source_path: Path = None,
+                 manifest: Manifest = None, dedup: bool = False, source_url: str = None,
+                 mirror: bool = False, sparse: bool = False, source_archive: str = None):
         self.is_git_install = is_git_install
+        self.manifest = manifest
+        self.dedup = dedup
+        self.mirror = bool(mirror and is_git_install)
+        self.sparse = bool(sparse and is_git_install)
+        # the archive a non git install was unpacked from, it has no source to update from
+        self.source_archive = None if is_git_install else source_archive
+        self.source_url = source_url if is_git_install else None
         if is_git_install:
             self.source_path = None
         else:
             self.source_path = source_path
 
-    def write(self, project_root: Path) -> Self:
-        metadata_path = project_root / METADATA_FILE
-
-        data = {
+    def as_dict(self) -> dict:
+        return {
             "is_git_install": self.is_git_install,
             "source_path": str(self.source_path) if self.source_path else None,
+            "dedup": self.dedup,
+            "source_url": self.source_url,
+            "mirror": self.mirror,
+            "sparse": self.sparse,
+            "source_archive": self.source_archive,
         }
 
+    def write(self, project_root: Path) -> Self:
+        metadata_path = project_root / METADATA_FILE
+        data = self.as_dict()
+
         metadata_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with metadata_path.open("w", encoding="utf-8") as f:
+        # replace rather than rewrite, the file may be hardlinked into an older version
+        tmp_path = metadata_path.with_name(metadata_path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
             json.dump(data, f)
+        os.replace(tmp_path, metadata_path)
+
+        if self.manifest is not None:
+            self.manifest.write(project_root)
         return self
 
     def update_from(self, project_root: Path) -> Self:
@@ -40,11 +67,72 @@ class MetaData:
         with metadata_path.open("r", encoding="utf-8") as f:
             data = json.load(f)
 
-        self.is_git_install = data.get("is_git_install", False)
+        # older installs stored the clone url here instead of a bool
+        self.is_git_install = bool(data.get("is_git_install", False))
+        self.dedup = data.get("dedup", False)
+        self.source_url = data.get("source_url") if self.is_git_install else None
+        self.mirror = bool(data.get("mirror", False)) and self.is_git_install
+        self.sparse = bool(data.get("sparse", False)) and self.is_git_install
+        self.source_archive = None if self.is_git_install else data.get("source_archive")
 
         source_path = data.get("source_path")
         if self.is_git_install:
             self.source_path = None
         else:
             self.source_path = Path(source_path) if source_path else None
+
+        self.manifest = Manifest.load(project_root)
+        return self
+
+    @staticmethod
+    def load(name: str, registry: Registry = None) -> Self:
+        """
+        The metadata of the install called name, from the registry, or from its metadata
+        file for installs made before the registry had every column.
+        Raises FileNotFoundError if neither knows the install.
+        """
+        meta_data = MetaData.from_registry(name, registry)
+        if meta_data is None:
+            meta_data = MetaData().update_from(DEFAULT_INSTALL_ROOT / name)
+        return meta_data
+
+    @staticmethod
+    def from_registry(name: str, registry: Registry = None) -> Self | None:
+        """
+        Builds metadata from the install's registry row, None if it has no row or a row
+        from before the mirror, sparse and archive columns. The manifest isn't part of
+        the registry, it is read from the active version.
+        """
+        row = (registry or Registry()).get(name)
+        if row is None or row.get("archive") is None:
+            return None
+        is_git = bool(row["is_git"])
+        source = row["source"]
+        archive = bool(row["archive"])
+        return MetaData(
+            is_git_install=is_git,
+            source_path=Path(source) if source and not is_git and not archive else None,
+            manifest=Manifest.load(DEFAULT_INSTALL_ROOT / name),
+            dedup=bool(row["dedup"]),
+            source_url=source if is_git else None,
+            mirror=bool(row["mirror"]),
+            sparse=bool(row["sparse"]),
+            source_archive=source if archive else None,
+        )
+
+    def register(self, name: str, revision: str = None, version: str = None,
+                 registry: Registry = None) -> Self:
+        """
+        Records this install in the registry, the index --list and --status read from.
+        """
+        (registry or Registry()).record_install(name, self, revision, version)
+        return self
+
+    def rebuild_manifest(self, tree_root: Path, exclude) -> Self:
+        """
+        Rescans tree_root for a fresh manifest, reusing hashes of unchanged files.
+        For local installs tree_root is the source so later checks can compare its stat,
+        the manifest is stored on the next call to write.
+        """
+        self.manifest = Manifest.build(tree_root, exclude, self.manifest)
         return self
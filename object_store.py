@@ -0,0 +1,109 @@
+import os
+import stat
+from dataclasses import dataclass
+from pathlib import Path
+from constants import STORE_DIR
+from manifest import Manifest, hash_file
+
+# write bits are stripped from every blob, a hardlink shares its mode with every install using it
+READ_ONLY_MASK = ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+@dataclass
+class DedupStats:
+    stored: int = 0
+    linked: int = 0
+    bytes_saved: int = 0
+
+    def summary(self) -> str:
+        return (f"linked {self.linked} files to shared blobs ({self.bytes_saved} bytes saved), "
+                f"stored {self.stored} new blobs")
+
+
+# content addressed store shared by all installs, a blob is a file named after the sha256
+# of its content and its read only mode. Installs hardlink to blobs so the link count
+# doubles as a reference count, a blob whose only link is the store itself is garbage.
+class ObjectStore:
+    def __init__(self, root: Path = STORE_DIR):
+        self.root = root
+        self.objects_dir = root / "objects"
+
+    def blob_path(self, digest: str, mode: int) -> Path:
+        blob_mode = stat.S_IMODE(mode) & READ_ONLY_MASK
+        return self.objects_dir / digest[:2] / f"{digest}.{blob_mode:o}"
+
+    def dedup(self, root: Path, manifest: Manifest) -> DedupStats:
+        """
+        Replaces the files under root listed in manifest with read only hardlinks
+        to their blobs, adding blobs for content the store hasn't seen yet.
+        """
+        stats = DedupStats()
+        for rel_path, record in manifest.files.items():
+            size, _, _, digest = record
+            if size == 0 or digest.startswith("link:"):
+                continue
+
+            path = root / rel_path
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+
+            blob = self.blob_path(digest, st.st_mode)
+            try:
+                blob_st = os.stat(blob)
+                if (blob_st.st_ino, blob_st.st_dev) == (st.st_ino, st.st_dev):
+                    continue
+            except FileNotFoundError:
+                pass
+
+            # the manifest describes the source, hash what was actually installed
+            digest = hash_file(str(path))
+            blob = self.blob_path(digest, st.st_mode)
+            self._link(path, st, blob, stats)
+        return stats
+
+    def _link(self, path: Path, st: os.stat_result, blob: Path, stats: DedupStats) -> None:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.dumb_link")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, path)
+            stats.linked += 1
+            stats.bytes_saved += st.st_size
+            return
+        except FileNotFoundError:
+            pass
+
+        os.chmod(path, stat.S_IMODE(st.st_mode) & READ_ONLY_MASK)
+        try:
+            os.link(path, blob)
+            stats.stored += 1
+        except FileExistsError:
+            # another install stored the same content first
+            self._link(path, st, blob, stats)
+
+    def collect_garbage(self) -> int:
+        """
+        Deletes blobs no install links to anymore, returns how many were removed.
+        The store is removed entirely once it is empty.
+        """
+        if not self.objects_dir.exists():
+            return 0
+
+        removed = 0
+        for fan_out in self.objects_dir.iterdir():
+            for blob in fan_out.iterdir():
+                if blob.lstat().st_nlink == 1:
+                    blob.unlink()
+                    removed += 1
+            if not any(fan_out.iterdir()):
+                fan_out.rmdir()
+
+        if not any(self.objects_dir.iterdir()):
+            self.objects_dir.rmdir()
+            self.root.rmdir()
+        return removed
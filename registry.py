@@ -0,0 +1,163 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from constants import REGISTRY_FILE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS installs (
+    name TEXT PRIMARY KEY,
+    source TEXT,
+    is_git INTEGER NOT NULL,
+    revision TEXT,
+    manifest_hash TEXT,
+    dedup INTEGER NOT NULL DEFAULT 0,
+    version TEXT,
+    installed_at REAL,
+    updated_at REAL,
+    last_result TEXT,
+    last_message TEXT,
+    mirror INTEGER,
+    sparse INTEGER,
+    archive INTEGER
+)
+"""
+# columns added after the first schema, registries made before them get them on the
+# next write, NULL until their install's metadata file has been read into them
+_ADDED_COLUMNS = ("mirror INTEGER", "sparse INTEGER", "archive INTEGER")
+
+COLUMNS = (
+    "name", "source", "is_git", "revision", "manifest_hash", "dedup", "version",
+    "installed_at", "updated_at", "last_result", "last_message", "mirror", "sparse", "archive",
+)
+
+
+def metadata_fields(meta_data) -> dict:
+    """
+    The registry columns that hold an install's metadata, MetaData.from_registry reads them back.
+    """
+    if meta_data.is_git_install:
+        source = meta_data.source_url
+    else:
+        source = meta_data.source_path or meta_data.source_archive
+    return {
+        "source": str(source) if source else None,
+        "is_git": int(meta_data.is_git_install),
+        "dedup": int(meta_data.dedup),
+        "mirror": int(meta_data.mirror),
+        "sparse": int(meta_data.sparse),
+        "archive": int(meta_data.source_archive is not None),
+    }
+
+
+def manifest_hash(manifest) -> str | None:
+    if manifest is None:
+        return None
+    encoded = json.dumps(manifest.files, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+# index of every install kept in one sqlite database under the install root, so listing
+# and querying installs doesn't have to open every install's metadata file.
+# A connection is opened per call which keeps it safe to use from update threads.
+class Registry:
+    def __init__(self, path: Path = REGISTRY_FILE):
+        self.path = path
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    @contextmanager
+    def _connect(self, write: bool = True) -> Iterator[sqlite3.Connection]:
+        """
+        A connection that commits on success and is closed afterwards, a connection left
+        open keeps its lock. Reads open the database read only, so --list and --status
+        work without write access to the install root.
+        """
+        if write:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+        else:
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            if write:
+                # a rollback journal rather than WAL: reading a WAL database needs its -shm
+                # file, which a reader without write access can't create
+                conn.execute("PRAGMA journal_mode=DELETE")
+                conn.execute(_SCHEMA)
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(installs)")}
+                for column in _ADDED_COLUMNS:
+                    if column.split()[0] not in existing:
+                        conn.execute(f"ALTER TABLE installs ADD COLUMN {column}")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_install(self, name: str, meta_data, revision: str = None,
+                       version: str = None, message: str = None) -> None:
+        """
+        Inserts or replaces the row for a fresh install.
+        """
+        now = time.time()
+        row = dict(metadata_fields(meta_data), name=name, revision=revision,
+                   manifest_hash=manifest_hash(meta_data.manifest), version=version,
+                   installed_at=now, updated_at=now, last_result="installed",
+                   last_message=message)
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO installs ({', '.join(row)}) "
+                f"VALUES ({', '.join('?' for _ in row)})",
+                tuple(row.values()),
+            )
+
+    def record_result(self, name: str, result: str, message: str = None, **fields) -> None:
+        """
+        Stores the outcome of an update along with any changed columns like revision or version.
+        """
+        assignments = {"last_result": result, "last_message": message, "updated_at": time.time()}
+        assignments.update({k: v for k, v in fields.items() if k in COLUMNS})
+        columns = ", ".join(f"{k} = ?" for k in assignments)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE installs SET {columns} WHERE name = ?",
+                (*assignments.values(), name),
+            )
+
+    def remove(self, name: str) -> None:
+        if not self.exists():
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM installs WHERE name = ?", (name,))
+            empty = conn.execute("SELECT COUNT(*) FROM installs").fetchone()[0] == 0
+        if empty:
+            self.delete()
+
+    def delete(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+
+    def get(self, name: str) -> dict | None:
+        if not self.exists():
+            return None
+        with self._connect(write=False) as conn:
+            row = conn.execute("SELECT * FROM installs WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def names(self) -> list[str]:
+        if not self.exists():
+            return []
+        with self._connect(write=False) as conn:
+            rows = conn.execute("SELECT name FROM installs ORDER BY name").fetchall()
+        return [row["name"] for row in rows]
+
+    def all(self) -> list[dict]:
+        if not self.exists():
+            return []
+        with self._connect(write=False) as conn:
+            rows = conn.execute("SELECT * FROM installs ORDER BY name").fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,113 @@
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from archive_utils import (  # noqa: E402
+    BUNDLE_HEADER, BUNDLE_VERSION, UnsafeArchiveError, extract_archive, import_bundle)
+
+# every link in the chain looks like it stays in the archive as text, on disk
+# each one climbs a directory further than the one before
+SYMLINK_CHAIN = [("d/x", ".."), ("d/x/y", ".."), ("d/x/y/z", ".."), ("d/x/y/z/w", "..")]
+
+
+CONFIG = ("dumb_build.toml", b'[build]\nexecutable_name = "evil"\ncommand = "true"\n')
+
+
+def _tar_bytes(members: list[tuple]) -> bytes:
+    """
+    A tar of (name, content) files, (name, None) directories, (name, linkname)
+    symlinks and (name, linkname, tarfile.LNKTYPE) hardlinks.
+    """
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w") as tar:
+        for name, value, *kind in members:
+            info = tarfile.TarInfo(name)
+            if value is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif isinstance(value, str):
+                info.type = kind[0] if kind else tarfile.SYMTYPE
+                info.linkname = value
+                tar.addfile(info)
+            else:
+                info.size = len(value)
+                tar.addfile(info, io.BytesIO(value))
+    return data.getvalue()
+
+
+class ArchiveTraversalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # deep enough that the chain lands inside tmp, where the test can see it
+        self.dest = Path(self.tmp.name, "a", "b", "c", "unpack")
+        self.dest.mkdir(parents=True)
+
+    def _written_outside(self) -> list[str]:
+        found = []
+        for directory, _, files in os.walk(self.tmp.name):
+            if "PWNED" in files:
+                found.append(directory)
+        return found
+
+    def _extract(self, members: list[tuple]):
+        archive = Path(self.tmp.name, "archive.tar")
+        archive.write_bytes(_tar_bytes([CONFIG, *members]))
+        return extract_archive(str(archive), self.dest)
+
+    def test_symlink_chain_is_refused(self):
+        with self.assertRaises(UnsafeArchiveError):
+            self._extract([("d", None), *SYMLINK_CHAIN, ("d/x/y/z/w/PWNED", b"pwned")])
+        self.assertEqual(self._written_outside(), [])
+        self.assertFalse(os.path.lexists(Path(self.tmp.name, "a", "b", "c", "z")))
+
+    def test_hardlink_through_symlink_is_refused(self):
+        Path(self.tmp.name, "secret").write_bytes(b"secret")
+        with self.assertRaises(UnsafeArchiveError):
+            self._extract([("d", None), *SYMLINK_CHAIN,
+                           ("stolen", "d/x/y/z/w/secret", tarfile.LNKTYPE)])
+        self.assertFalse(os.path.lexists(self.dest / "stolen"))
+
+    def test_links_inside_the_archive_still_work(self):
+        root, _, _ = self._extract([("lib", None), ("lib/data.txt", b"data"),
+                                    ("current", "lib"), ("current/more.txt", b"more")])
+        self.assertEqual((root / "lib" / "more.txt").read_bytes(), b"more")
+        self.assertEqual(os.readlink(root / "current"), "lib")
+
+
+
+class BundleTraversalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dest = Path(self.tmp.name, "a", "b", "c", "unpack")
+        self.dest.mkdir(parents=True)
+
+    def test_symlink_chain_is_refused(self):
+        # the manifest travels in the bundle, so it vouches for whatever the bundle holds
+        content = b"pwned"
+        manifest = {name: [0, 0, 0o120777, "link:" + linkname] for name, linkname in SYMLINK_CHAIN}
+        manifest["d/x/y/z/w/PWNED"] = [len(content), 0, 0o100644,
+                                       hashlib.sha256(content).hexdigest()]
+        header = json.dumps({"version": BUNDLE_VERSION, "config": {}, "manifest": manifest,
+                             "exclude": []}).encode()
+        bundle = Path(self.tmp.name, "evil.tar")
+        bundle.write_bytes(_tar_bytes([(BUNDLE_HEADER, header), *SYMLINK_CHAIN,
+                                       ("d/x/y/z/w/PWNED", content)]))
+
+        with self.assertRaises(UnsafeArchiveError):
+            import_bundle(str(bundle), self.dest)
+        for directory, _, files in os.walk(self.tmp.name):
+            self.assertNotIn("PWNED", files, directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
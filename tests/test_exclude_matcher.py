@@ -0,0 +1,124 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from exclude_matcher import ExcludeMatcher  # noqa: E402
+
+
+class AnchoringTest(unittest.TestCase):
+    def test_plain_name_matches_at_any_depth(self):
+        matcher = ExcludeMatcher(["*.pyc", "build"])
+        self.assertTrue(matcher.matches("m.pyc"))
+        self.assertTrue(matcher.matches("pkg/sub/m.pyc"))
+        self.assertTrue(matcher.matches("pkg/build", is_dir=True))
+        self.assertFalse(matcher.matches("m.py"))
+
+    def test_slash_anchors_to_the_root(self):
+        matcher = ExcludeMatcher(["/dist", "docs/build"])
+        self.assertTrue(matcher.matches("dist", is_dir=True))
+        self.assertFalse(matcher.matches("pkg/dist", is_dir=True))
+        self.assertTrue(matcher.matches("docs/build"))
+        self.assertFalse(matcher.matches("pkg/docs/build"))
+
+    def test_star_does_not_cross_directories(self):
+        matcher = ExcludeMatcher(["/src/*.py"])
+        self.assertTrue(matcher.matches("src/a.py"))
+        self.assertFalse(matcher.matches("src/pkg/a.py"))
+
+
+class DoubleStarTest(unittest.TestCase):
+    def test_trailing_double_star_matches_everything_inside(self):
+        matcher = ExcludeMatcher(["build/**"])
+        self.assertTrue(matcher.matches("build/a"))
+        self.assertTrue(matcher.matches("build/a/b.txt"))
+        self.assertFalse(matcher.matches("build", is_dir=True))
+
+    def test_double_star_in_the_middle_matches_zero_or_more_directories(self):
+        matcher = ExcludeMatcher(["a/**/b"])
+        self.assertTrue(matcher.matches("a/b"))
+        self.assertTrue(matcher.matches("a/x/b"))
+        self.assertTrue(matcher.matches("a/x/y/b"))
+        self.assertFalse(matcher.matches("a/x/c"))
+
+    def test_leading_double_star_matches_at_any_depth(self):
+        matcher = ExcludeMatcher(["**/cache"])
+        self.assertTrue(matcher.matches("cache", is_dir=True))
+        self.assertTrue(matcher.matches("x/y/cache", is_dir=True))
+
+
+class DirectoryOnlyTest(unittest.TestCase):
+    def test_trailing_slash_only_matches_directories(self):
+        matcher = ExcludeMatcher(["logs/"])
+        self.assertTrue(matcher.matches("logs", is_dir=True))
+        self.assertTrue(matcher.matches("app/logs", is_dir=True))
+        self.assertFalse(matcher.matches("logs"))
+
+    def test_excludes_looks_at_parent_directories(self):
+        matcher = ExcludeMatcher(["logs/"])
+        self.assertTrue(matcher.excludes("logs/today.txt"))
+        self.assertFalse(matcher.matches("logs/today.txt"))
+
+
+class NegationTest(unittest.TestCase):
+    def test_negation_reincludes_what_an_earlier_pattern_excluded(self):
+        matcher = ExcludeMatcher(["*.txt", "!keep.txt"])
+        self.assertTrue(matcher.matches("notes.txt"))
+        self.assertFalse(matcher.matches("keep.txt"))
+        self.assertFalse(matcher.matches("sub/keep.txt"))
+
+    def test_last_matching_pattern_wins(self):
+        matcher = ExcludeMatcher(["!keep.txt", "*.txt"])
+        self.assertTrue(matcher.matches("keep.txt"))
+
+    def test_escaped_bang_is_a_literal_name(self):
+        matcher = ExcludeMatcher(["\\!keep"])
+        self.assertTrue(matcher.matches("!keep"))
+        self.assertFalse(matcher.matches("keep"))
+
+
+class BracketTest(unittest.TestCase):
+    def test_class_and_range(self):
+        matcher = ExcludeMatcher(["*.py[co]", "v[0-9]"])
+        self.assertTrue(matcher.matches("m.pyc"))
+        self.assertTrue(matcher.matches("m.pyo"))
+        self.assertFalse(matcher.matches("m.py"))
+        self.assertTrue(matcher.matches("v7"))
+        self.assertFalse(matcher.matches("v-"))
+
+    def test_leading_close_bracket_is_literal(self):
+        self.assertTrue(ExcludeMatcher(["[]]"]).matches("]"))
+        self.assertFalse(ExcludeMatcher(["[]]"]).matches("a"))
+        matcher = ExcludeMatcher(["[!]]x"])
+        self.assertTrue(matcher.matches("ax"))
+        self.assertFalse(matcher.matches("]x"))
+
+    def test_caret_negates_like_bang(self):
+        matcher = ExcludeMatcher(["[^a]"])
+        self.assertTrue(matcher.matches("b"))
+        self.assertFalse(matcher.matches("a"))
+
+    def test_unclosed_bracket_is_literal(self):
+        self.assertTrue(ExcludeMatcher(["[abc"]).matches("[abc"))
+        self.assertTrue(ExcludeMatcher(["x["]).matches("x["))
+
+    def test_escapes_inside_a_class(self):
+        matcher = ExcludeMatcher(["[\\]a]"])
+        self.assertTrue(matcher.matches("]"))
+        self.assertTrue(matcher.matches("a"))
+        self.assertFalse(matcher.matches("\\"))
+
+    def test_class_never_matches_a_slash(self):
+        self.assertFalse(ExcludeMatcher(["/a[!x]b"]).matches("a/b"))
+        self.assertFalse(ExcludeMatcher(["/a[/]b"]).matches("a/b"))
+
+    def test_regex_characters_in_a_class_are_literal(self):
+        matcher = ExcludeMatcher(["[&&~]", "[[]"])
+        self.assertTrue(matcher.matches("&"))
+        self.assertTrue(matcher.matches("["))
+        self.assertFalse(matcher.matches("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from git_wrapper import GitWrapper  # noqa: E402
+
+DIN = Path(__file__).resolve().parent.parent / "dumb_installer.py"
+GIT = ["git", "-c", "user.name=test", "-c", "user.email=test@localhost",
+       "-c", "init.defaultBranch=main"]
+
+CONFIG = ('[build]\n'
+          'executable_name = "remote_test"\n'
+          'command = "cat $dumb_project_dir/main.txt"\n'
+          'excluded = ["assets"]\n')
+
+
+def git(*args, cwd: Path) -> str:
+    return subprocess.run([*GIT, *args], cwd=cwd, check=True, capture_output=True,
+                          text=True).stdout.strip()
+
+
+class RemoteTestCase(unittest.TestCase):
+    """
+    Each test gets a work tree with one commit pushed to a bare repo,
+    both in a temp directory. url is the bare repo's file:// url.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.work = self.tmp / "work"
+        self.bare = self.tmp / "remote.git"
+        self.url = f"file://{self.bare}"
+
+        (self.work / "assets").mkdir(parents=True)
+        (self.work / "assets" / "big.bin").write_bytes(os.urandom(4096))
+        (self.work / "main.txt").write_text("hello\n")
+        (self.work / "dumb_build.toml").write_text(CONFIG)
+        git("init", "-q", cwd=self.work)
+        git("add", "-A", cwd=self.work)
+        git("commit", "-q", "-m", "initial", cwd=self.work)
+        git("init", "-q", "--bare", str(self.bare), cwd=self.tmp)
+        git("symbolic-ref", "HEAD", "refs/heads/main", cwd=self.bare)
+        self.push()
+
+    def push(self) -> None:
+        git("push", "-q", str(self.bare), "HEAD:main", cwd=self.work)
+
+    def commit_change(self, text: str) -> str:
+        (self.work / "main.txt").write_text(text)
+        git("commit", "-q", "-am", "change", cwd=self.work)
+        self.push()
+        return git("rev-parse", "HEAD", cwd=self.work)
+
+
+class RecordingGitWrapper(GitWrapper):
+    def __init__(self):
+        super().__init__()
+        self.commands: list[str] = []
+
+    def _run_git(self, args, cwd=None):
+        self.commands.append(args[0])
+        return super()._run_git(args, cwd)
+
+
+class ProbeTest(RemoteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clone = self.tmp / "clone"
+        self.assertTrue(GitWrapper().cloneTo(self.url, str(self.clone)).success)
+
+    def test_unchanged_remote_skips_the_fetch(self):
+        wrapper = RecordingGitWrapper()
+        wrapper.probe_remotes([self.clone])
+        self.assertTrue(wrapper.is_up_to_date(self.clone))
+
+        result = wrapper.updateRepoAtPath(self.clone)
+        self.assertFalse(result.success)
+        self.assertEqual(result.failureMessage, "Repository is already up to date.")
+        self.assertEqual(wrapper.commands, ["ls-remote"])
+
+    def test_clones_of_one_remote_share_a_probe(self):
+        other = self.tmp / "other"
+        self.assertTrue(GitWrapper().cloneTo(self.url, str(other)).success)
+
+        wrapper = RecordingGitWrapper()
+        wrapper.probe_remotes([self.clone, other])
+        self.assertTrue(wrapper.is_up_to_date(self.clone))
+        self.assertTrue(wrapper.is_up_to_date(other))
+        self.assertEqual(wrapper.commands, ["ls-remote"])
+
+    def test_moved_remote_is_fetched(self):
+        revision = self.commit_change("hello again\n")
+
+        wrapper = RecordingGitWrapper()
+        wrapper.probe_remotes([self.clone])
+        self.assertFalse(wrapper.is_up_to_date(self.clone))
+
+        result = wrapper.updateRepoAtPath(self.clone)
+        self.assertTrue(result.success, result.realMessage)
+        self.assertIn("fetch", wrapper.commands)
+        self.assertEqual(result.new_revision, revision)
+        self.assertEqual(wrapper.head_revision(self.clone), revision)
+        self.assertEqual((self.clone / "main.txt").read_text(), "hello again\n")
+
+
+class MirrorTest(RemoteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mirror_dir = self.tmp / "mirrors"
+        self.assertTrue(GitWrapper().update_mirror(self.url, self.mirror_dir).success)
+        self.mirror = GitWrapper().mirror_path(self.url, self.mirror_dir)
+        self.clone = self.tmp / "clone"
+        self.assertTrue(GitWrapper().cloneTo(self.url, str(self.clone), self.mirror).success)
+
+    def test_reference_clone_borrows_objects_from_the_mirror(self):
+        alternates = (self.clone / ".git" / "objects" / "info" / "alternates").read_text()
+        self.assertEqual(Path(alternates.strip()).resolve(), (self.mirror / "objects").resolve())
+        self.assertEqual(GitWrapper().object_counts(self.clone), (0, 0))
+        self.assertEqual((self.clone / "main.txt").read_text(), "hello\n")
+
+    def test_mirror_is_synced_once_per_wrapper(self):
+        wrapper = RecordingGitWrapper()
+        self.assertTrue(wrapper.update_mirror(self.url, self.mirror_dir).success)
+        self.assertTrue(wrapper.update_mirror(self.url, self.mirror_dir).success)
+        self.assertEqual(wrapper.commands, ["fetch"])
+
+    def test_update_reads_new_objects_from_the_mirror(self):
+        revision = self.commit_change("hello again\n")
+        self.assertTrue(GitWrapper().update_mirror(self.url, self.mirror_dir).success)
+        git("cat-file", "-e", revision, cwd=self.mirror)
+
+        result = GitWrapper().updateRepoAtPath(self.clone, shallow=False)
+        self.assertTrue(result.success, result.realMessage)
+        self.assertEqual(result.new_revision, revision)
+        self.assertEqual((self.clone / "main.txt").read_text(), "hello again\n")
+        # the fetch found every object through alternates and stored none itself
+        self.assertEqual(GitWrapper().object_counts(self.clone), (0, 0))
+
+
+class SparseInstallTest(RemoteTestCase):
+    def setUp(self):
+        super().setUp()
+        git("config", "uploadpack.allowFilter", "true", cwd=self.bare)
+        self.install_root = self.tmp / "root"
+        env = dict(os.environ, DUMB_INSTALL_ROOT=str(self.install_root),
+                   DUMB_BIN_DIR=str(self.tmp / "bin"))
+        result = subprocess.run([sys.executable, str(DIN), self.url, "--sparse"],
+                                cwd=self.tmp, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.install_dir = self.install_root / "remote_test"
+
+    def missing_objects(self) -> set[str]:
+        # --missing=print lists what a partial clone lacks without fetching it
+        out = git("rev-list", "--objects", "--all", "--missing=print", cwd=self.install_dir)
+        return {line[1:] for line in out.splitlines() if line.startswith("?")}
+
+    def test_excluded_blobs_are_never_fetched(self):
+        blob = git("rev-parse", "HEAD:assets/big.bin", cwd=self.work)
+        self.assertIn(blob, self.missing_objects())
+        self.assertFalse((self.install_dir / "assets").exists())
+
+    def test_checked_out_blobs_are_fetched(self):
+        missing = self.missing_objects()
+        for path in ("main.txt", "dumb_build.toml"):
+            self.assertNotIn(git("rev-parse", f"HEAD:{path}", cwd=self.work), missing)
+        self.assertEqual((self.install_dir / "main.txt").read_text(), "hello\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
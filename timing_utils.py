@@ -0,0 +1,145 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# label for work that isn't done for one install, like probing remotes for --update-all
+GLOBAL = "din"
+GIT = "git"
+
+_recorder = None
+_local = threading.local()
+
+
+class Recorder:
+    """
+    Collects the phases din goes through for each install, the git processes it spawns
+    and counters like the bytes copied. Spans are (install, name, category, start, end, thread).
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: list[tuple[str, str, str, float, float, int]] = []
+        self.counters: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, install: str, name: str, category: str, start: float, end: float) -> None:
+        with self._lock:
+            self.spans.append((install, name, category, start, end, threading.get_ident()))
+
+    def add_count(self, install: str, name: str, amount: int) -> None:
+        with self._lock:
+            counters = self.counters.setdefault(install, {})
+            counters[name] = counters.get(name, 0) + amount
+
+    def summary(self) -> dict:
+        """
+        Totals per install: seconds per phase, the number and duration of git processes
+        and the counters. A phase entered more than once is summed.
+        """
+        installs: dict[str, dict] = {}
+
+        def entry_for(install: str) -> dict:
+            return installs.setdefault(install, {"phases": {}, "git": {"count": 0, "seconds": 0.0},
+                                                 "counters": {}})
+
+        for install, name, category, start, end, _ in self.spans:
+            entry = entry_for(install)
+            if category == GIT:
+                entry["git"]["count"] += 1
+                entry["git"]["seconds"] += end - start
+            else:
+                entry["phases"][name] = entry["phases"].get(name, 0.0) + end - start
+        for install, counters in self.counters.items():
+            entry_for(install)["counters"] = dict(counters)
+        return {"total_seconds": time.perf_counter() - self.start, "installs": installs}
+
+    def table(self) -> str:
+        summary = self.summary()
+        lines = [f"timings ({summary['total_seconds']:.3f}s total):"]
+        for install, entry in sorted(summary["installs"].items()):
+            lines.append(f"  {install}")
+            for name, seconds in entry["phases"].items():
+                lines.append(f"    {name:<20}{seconds:>10.4f}s")
+            git = entry["git"]
+            if git["count"]:
+                lines.append(f"    {'git processes':<20}{git['seconds']:>10.4f}s  ({git['count']} spawned)")
+            for name, value in entry["counters"].items():
+                lines.append(f"    {name:<20}{value:>10}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """
+        The spans in the Chrome trace event format, for chrome://tracing or Perfetto.
+        Each thread is its own track, so concurrent updates show up side by side.
+        """
+        threads: dict[int, int] = {}
+        events = []
+        for install, name, category, start, end, thread in self.spans:
+            tid = threads.setdefault(thread, len(threads))
+            events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.start) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": 1,
+                "tid": tid,
+                "args": {"install": install},
+            })
+        for install, counters in self.counters.items():
+            events.append({"name": install, "ph": "C", "ts": 0, "pid": 1, "args": counters})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def report(self, fmt: str | None, trace_file: Path | None) -> None:
+        if fmt == "table":
+            print(self.table(), file=sys.stderr)
+        elif fmt == "json":
+            print(json.dumps(self.summary(), indent=2), file=sys.stderr)
+        if trace_file is not None:
+            trace_file.write_text(json.dumps(self.chrome_trace()))
+
+
+def enable() -> Recorder:
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def current_install() -> str:
+    return getattr(_local, "install", GLOBAL)
+
+
+def set_install(name: str) -> None:
+    """Attributes everything this thread records from now on to the install called name."""
+    _local.install = name
+
+
+@contextmanager
+def for_install(name: str):
+    """Attributes everything recorded by this thread to the install called name."""
+    previous = current_install()
+    set_install(name)
+    try:
+        yield
+    finally:
+        set_install(previous)
+
+
+@contextmanager
+def phase(name: str, category: str = "phase"):
+    if _recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _recorder.add_span(current_install(), name, category, start, time.perf_counter())
+
+
+def count(name: str, amount: int = 1) -> None:
+    if _recorder is not None:
+        _recorder.add_count(current_install(), name, amount)
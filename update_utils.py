@@ -0,0 +1,409 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from build_config_utils import BuildConfig
+from constants import DEFAULT_INSTALL_ROOT, DEFAULT_UPDATE_JOBS, METADATA_FILE, MANIFEST_FILE
+from constants import CONFIG_FILE, MIRROR_DIR, DEFAULT_BIN_DIR, VENV_DIR, VENV_LINK
+from debug_utils import error
+from file_utils import SyncStats, compare_trees, sync_project, remove_excluded
+from file_utils import remove_excluded_paths
+from git_wrapper import GitResult, GitWrapper, sparse_checkout_patterns
+from install_versions import VersionedInstall, installed_names
+from meta_data import MetaData
+from object_store import ObjectStore
+from registry import Registry, manifest_hash, metadata_fields
+from timing_utils import phase, count, for_install
+from wrapper_utils import write_wrapper
+
+UPDATED = "updated"
+UP_TO_DATE = "up to date"
+FAILED = "failed"
+ROLLED_BACK = "rolled back"
+
+INTERNAL_PATTERNS = ["/" + METADATA_FILE, "/" + MANIFEST_FILE, "/" + VENV_LINK]
+
+
+def dedup_install(install_dir: Path, meta_data: MetaData, log=print) -> None:
+    if not meta_data.dedup or meta_data.manifest is None:
+        return
+    with phase("dedup"):
+        stats = ObjectStore().dedup(install_dir, meta_data.manifest)
+    log(f"dedup: {stats.summary()}")
+
+
+def precompile_install(staging: Path, build: BuildConfig, exclude, display_dir: Path,
+                       log=print, paths: list[str] = None) -> None:
+    if build is None or not build.precompile:
+        return
+    # the process pool behind precompile is only worth importing for installs that use it
+    from bytecode_utils import precompile
+    with phase("precompile"):
+        stats = precompile(staging, display_dir, exclude, paths=paths)
+    log(f"precompile: {stats.summary()}")
+
+
+def venv_install(staging: Path, build: BuildConfig, project_root: Path, executable_name: str,
+                 log=print) -> None:
+    if build is None or (build.requirements is None and not os.path.lexists(staging / VENV_LINK)):
+        return
+    # venvs need subprocess and the bytecode compiler, only installs with requirements import them
+    from venv_utils import provision_venv, VenvError
+    try:
+        provision_venv(staging, build, project_root, executable_name, log)
+    except VenvError as e:
+        error(f"couldn't set up the venv of {executable_name}: {e}")
+
+
+def refresh_venv(executable_name: str, had_venv: bool | None = None) -> None:
+    """
+    After switching versions: deletes venvs no kept version links to and rewrites
+    the wrapper when the active version gained or lost its venv, unless had_venv is None.
+    """
+    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    if (VENV_DIR / executable_name).is_dir():
+        from venv_utils import collect_venvs
+        collect_venvs(executable_name, VersionedInstall(executable_name).versions())
+
+    has_venv = os.path.islink(install_dir / VENV_LINK)
+    if had_venv is None or has_venv == had_venv:
+        return
+    build = BuildConfig.safe_get_build_config(install_dir)
+    if build is not None:
+        write_wrapper(executable_name, build.command, install_dir, DEFAULT_BIN_DIR, build.wrapper,
+                      install_dir / VENV_LINK if has_venv else None)
+
+
+def collect_store_garbage() -> None:
+    with phase("store gc"):
+        removed = ObjectStore().collect_garbage()
+    if removed:
+        print(f"removed {removed} unreferenced blobs from the object store")
+
+
+def count_copied(stats: SyncStats) -> None:
+    count("files copied", stats.files_copied)
+    count("bytes copied", stats.bytes_copied)
+    count("files removed", stats.files_removed)
+
+
+def update_executable(executable_name: str, log=print, git_wrapper: GitWrapper = None) -> str:
+    """
+    Updates a single install, returns UPDATED, UP_TO_DATE or FAILED.
+    All output goes through log so concurrent updates can collect it.
+    Blobs this update stopped using are left for collect_store_garbage.
+    The outcome is recorded in the registry.
+    """
+    lines = []
+
+    def collect(line: str) -> None:
+        lines.append(line)
+        log(line)
+
+    with for_install(executable_name):
+        try:
+            status = _update_executable(executable_name, collect, git_wrapper)
+        except BaseException as e:
+            record_update(executable_name, FAILED, repr(e))
+            raise
+
+        with phase("registry"):
+            record_update(executable_name, status, lines[-1] if lines else None)
+    return status
+
+
+def record_update(executable_name: str, status: str, message: str) -> None:
+    registry = Registry()
+    row = registry.get(executable_name)
+    if row is None:
+        register_install(executable_name)
+    fields = {}
+    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    if status in (UPDATED, ROLLED_BACK) or (row is not None and row.get("archive") is None):
+        # the active version's metadata file is what was just installed or rolled back to,
+        # it also fills in the columns of rows made before the registry had them
+        try:
+            meta_data = MetaData().update_from(install_dir)
+        except FileNotFoundError:
+            meta_data = None
+        if meta_data is not None:
+            fields = metadata_fields(meta_data)
+            if status in (UPDATED, ROLLED_BACK):
+                fields.update(install_fields(executable_name, meta_data))
+    registry.record_result(executable_name, status, message, **fields)
+
+
+def install_fields(executable_name: str, meta_data: MetaData) -> dict:
+    """
+    The registry columns that describe the active version of an install.
+    """
+    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    current = VersionedInstall(executable_name).current()
+    return {
+        "revision": GitWrapper().head_revision(install_dir) if meta_data.is_git_install else None,
+        "version": current.name if current else None,
+        "manifest_hash": manifest_hash(meta_data.manifest),
+    }
+
+
+def register_install(executable_name: str) -> None:
+    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    try:
+        meta_data = MetaData().update_from(install_dir)
+    except FileNotFoundError:
+        return
+    fields = install_fields(executable_name, meta_data)
+    meta_data.register(executable_name, fields["revision"], fields["version"])
+
+
+def rebuild_registry() -> None:
+    """
+    Indexes installs made before the registry existed, a one time scan of their metadata.
+    """
+    for name in installed_names():
+        register_install(name)
+
+
+def registered_names() -> list[str]:
+    """
+    The names of every install, from the registry. Installs made before it existed
+    are indexed on the first call.
+    """
+    registry = Registry()
+    if not registry.exists():
+        rebuild_registry()
+    return registry.names()
+
+
+def _update_executable(executable_name: str, log=print, git_wrapper: GitWrapper = None) -> str:
+    log(f"Updating {executable_name}...")
+    install_dir = DEFAULT_INSTALL_ROOT / executable_name
+    if not install_dir.exists():
+        log(f"Failed: couldn't find source directory at {install_dir}")
+        return FAILED
+
+    with phase("metadata"):
+        meta_data = MetaData.load(executable_name)
+    is_git = meta_data.is_git_install
+    versioned = VersionedInstall(executable_name)
+    had_venv = os.path.islink(install_dir / VENV_LINK)
+
+    if is_git:
+        git_wrapper = git_wrapper or GitWrapper()
+        with phase("remote check"):
+            up_to_date = git_wrapper.is_up_to_date(install_dir)
+        if up_to_date:
+            log("already up to date")
+            return UP_TO_DATE
+
+        if meta_data.mirror:
+            # new objects go into the mirror once and reach the install through alternates
+            with phase("mirror"):
+                mirror_result = git_wrapper.update_mirror(meta_data.source_url, MIRROR_DIR)
+            if not mirror_result.success:
+                log(f"couldn't update the mirror, fetching from the remote: "
+                    f"{mirror_result.failureMessage}")
+
+        # what din wrote into the install survives the clean, so unchanged files
+        # keep their bytecode instead of being compiled again
+        old_build = BuildConfig.safe_get_build_config(install_dir)
+        keep = list(INTERNAL_PATTERNS)
+        if old_build:
+            keep += old_build.get_generated_matcher().patterns
+
+        with phase("stage"):
+            staging = versioned.stage()
+        try:
+            with phase("git update"):
+                result = git_wrapper.updateRepoAtPath(staging, shallow=not meta_data.mirror,
+                                                      keep=tuple(keep))
+            if not result.success:
+                versioned.discard(staging)
+                if "already up to date" in result.failureMessage:
+                    log("already up to date")
+                    return UP_TO_DATE
+                log(f"Failed to update: {result.failureMessage}")
+                return FAILED
+
+            # incase something was added or deleted from the excluded section's
+
+            with phase("config"):
+                build = BuildConfig.safe_get_build_config(staging)
+
+            if build and meta_data.sparse:
+                # the new commit may exclude different paths, checking out what they
+                # leave fetches newly included blobs and drops newly excluded files
+                patterns = sparse_checkout_patterns(build.get_remote_excluded_files())
+                if git_wrapper.sparse_patterns(staging) != patterns:
+                    with phase("checkout"):
+                        checkout_result = git_wrapper.checkout(staging, patterns)
+                    if not checkout_result.success:
+                        versioned.discard(staging)
+                        log(f"Failed to apply the new excludes: {checkout_result.failureMessage}")
+                        return FAILED
+
+            if build:
+                with phase("remove excluded"):
+                    remove_changed_excluded(staging, build, result, git_wrapper)
+            else:
+                log("no build file found during update")
+
+            generated = build.get_generated_matcher().patterns if build else []
+            with phase("manifest"):
+                meta_data.rebuild_manifest(
+                    staging, INTERNAL_PATTERNS + [".git"] + generated).write(staging)
+            dedup_install(staging, meta_data, log)
+            if build:
+                precompile_install(staging, build, build.get_remote_exclude_matcher(".git"),
+                                   install_dir, log)
+            venv_install(staging, build, staging, executable_name, log)
+        except BaseException:
+            versioned.discard(staging)
+            raise
+
+        with phase("activate"):
+            versioned.activate(staging)
+        refresh_venv(executable_name, had_venv)
+        log("updated")
+        return UPDATED
+
+    if meta_data.source_archive:
+        log(f"installed from {meta_data.source_archive}, install a newer archive to update it")
+        return UP_TO_DATE
+
+    source_dir = meta_data.source_path
+    if source_dir is None:
+        log("No source directory path")
+        return FAILED
+
+    if not source_dir.exists():
+        log(f"Failed: couldn't find source directory at {source_dir}")
+        return FAILED
+
+    if not (source_dir / CONFIG_FILE).exists():
+        log(f"Failed: couldn't find source directory at {source_dir}")
+        return FAILED
+
+    with phase("config"):
+        build = BuildConfig(source_dir)
+
+    # add the metadata files for the directoires_differ call
+    exclude = build.get_local_exclude_matcher(*INTERNAL_PATTERNS)
+    # anything else the excludes match is removed from the install
+    keep = build.get_generated_matcher().extended(INTERNAL_PATTERNS)
+
+    manifest = meta_data.manifest
+    diff = None
+    with phase("tree diff"):
+        if manifest is not None and not manifest.is_stale_for(exclude):
+            changed = manifest.tree_differs(source_dir)
+        else:
+            # no usable manifest, fall back to a full scan and rebuild it.
+            # the scan's change set lets the sync skip scanning again
+            diff = compare_trees(install_dir, source_dir, exclude, keep=keep)
+            changed = bool(diff)
+            if not changed:
+                meta_data.rebuild_manifest(source_dir, exclude).write(install_dir)
+
+    if not changed:
+        log("already up to date")
+        return UP_TO_DATE
+
+    # the manifest is taken before copying, if the source changes mid sync
+    # the next check sees a mismatch instead of missing the change
+    data = MetaData(is_git_install=is_git, source_path=source_dir,
+                    manifest=meta_data.manifest, dedup=meta_data.dedup)
+    with phase("manifest"):
+        data.rebuild_manifest(source_dir, exclude)
+
+    with phase("stage"):
+        staging = versioned.stage()
+    try:
+        with phase("sync"):
+            stats = sync_project(source_dir, staging, exclude, diff=diff, keep=keep)
+        count_copied(stats)
+        data.write(staging)
+        dedup_install(staging, data, log)
+        precompile_install(staging, build, exclude, install_dir, log)
+        venv_install(staging, build, source_dir, executable_name, log)
+    except BaseException:
+        versioned.discard(staging)
+        raise
+
+    with phase("activate"):
+        versioned.activate(staging)
+    refresh_venv(executable_name, had_venv)
+    log(f"updated: {stats.summary()}")
+    return UPDATED
+
+
+def remove_changed_excluded(staging: Path, build: BuildConfig, result: GitResult,
+                            git_wrapper: GitWrapper) -> None:
+    """
+    Removes excluded files from a git install after an update. Files the previous version
+    had are already clean, so only the paths the update added or modified are checked,
+    unless the excludes themselves may have changed.
+    """
+    changed = None
+    if result.old_revision and result.new_revision:
+        changed = git_wrapper.changed_paths(staging, result.old_revision, result.new_revision)
+
+    if changed is None or CONFIG_FILE in changed:
+        # files excluded before may not be anymore, bring everything back and clean it all
+        git_wrapper.restore_work_tree(staging)
+        remove_excluded(staging, build.get_remote_excluded_files(),
+                        keep=build.get_generated_matcher())
+    else:
+        remove_excluded_paths(staging, changed, build.get_remote_excluded_files(),
+                              keep=build.get_generated_matcher())
+
+
+@dataclass
+class UpdateReport:
+    name: str
+    status: str
+    elapsed: float
+    lines: list[str]
+
+
+def _run_update(executable_name: str, git_wrapper: GitWrapper) -> UpdateReport:
+    lines = []
+    start = time.monotonic()
+    try:
+        status = update_executable(executable_name, lines.append, git_wrapper)
+    except BaseException as e:
+        # error() exits, keep one broken install from taking down the others
+        lines.append(f"Failed to update: {e!r}")
+        status = FAILED
+    return UpdateReport(executable_name, status, time.monotonic() - start, lines)
+
+
+def update_all(jobs: int = DEFAULT_UPDATE_JOBS) -> None:
+    names = registered_names()
+    if not names:
+        return
+
+    start = time.monotonic()
+    reports = []
+
+    # one ls-remote per distinct remote lets up to date git installs skip fetching
+    git_wrapper = GitWrapper()
+    with phase("probe remotes"):
+        git_wrapper.probe_remotes([DEFAULT_INSTALL_ROOT / name for name in names], jobs)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(_run_update, name, git_wrapper) for name in names]
+        # print each install's output as one block as soon as it finishes
+        for future in as_completed(futures):
+            report = future.result()
+            print("\n".join(report.lines), flush=True)
+            reports.append(report)
+
+    collect_store_garbage()
+
+    print(f"\nSummary ({time.monotonic() - start:.2f}s, {max(1, jobs)} jobs):")
+    for status in (UPDATED, UP_TO_DATE, FAILED):
+        group = sorted((r for r in reports if r.status == status), key=lambda r: r.name)
+        entries = ", ".join(f"{r.name} ({r.elapsed:.2f}s)" for r in group)
+        print(f"  {status} ({len(group)}): {entries}")
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from build_config_utils import BuildConfig
+from bytecode_utils import precompile
+from constants import VENV_DIR, WHEEL_CACHE_DIR, VENV_LINK
+from manifest import Manifest
+from object_store import ObjectStore
+from timing_utils import phase
+
+# written into a venv once it is complete, a venv without it was interrupted and is rebuilt
+COMPLETE_MARKER = ".dumb_complete"
+# bytecode embeds the mtime of its source, which a hardlink to a shared blob changes,
+# so it is left out of the store and compiled after linking
+BYTECODE_PATTERNS = ["__pycache__", "*.pyc", "/" + COMPLETE_MARKER]
+
+
+class VenvError(Exception):
+    pass
+
+
+def _run(args: list[str]) -> None:
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise VenvError(f"{' '.join(args)} failed:\n{result.stdout}{result.stderr}")
+
+
+def _requirements_hash(requirements: Path, interpreter: str, wheelhouse: Path | None) -> str:
+    digest = hashlib.sha256()
+    digest.update(os.path.realpath(interpreter).encode())
+    digest.update(b"\0" + requirements.read_bytes() + b"\0")
+    if wheelhouse is not None:
+        # pip only looks at the top level of --find-links, a wheel added or replaced there
+        # can change what unpinned requirements resolve to
+        with os.scandir(wheelhouse) as it:
+            wheels = sorted((e.name, e.stat().st_size) for e in it if e.is_file())
+        for name, size in wheels:
+            digest.update(f"{name}\0{size}\0".encode())
+    return digest.hexdigest()
+
+
+def _build_venv(venv: Path, interpreter: str, requirements: Path, wheelhouse: Path | None,
+                log=print) -> None:
+    # the scripts pip writes hold the venv's absolute path, so it is built where it stays
+    shutil.rmtree(venv, ignore_errors=True)
+    venv.parent.mkdir(parents=True, exist_ok=True)
+    _run([interpreter, "-m", "venv", "--without-pip", str(venv)])
+
+    # the interpreter's own pip installs into the venv, bootstrapping pip into every venv
+    # takes seconds and adds hundreds of files to it
+    python = str(venv / "bin" / "python")
+    flags = ["--disable-pip-version-check", "--no-input"]
+    pip = [interpreter, "-m", "pip", "--python", python, *flags]
+    if subprocess.run([*pip, "--version"], capture_output=True).returncode != 0:
+        # no pip, or one older than --python
+        _run([python, "-m", "ensurepip", "--default-pip"])
+        pip = [python, "-m", "pip", *flags]
+    if wheelhouse is None:
+        # fill the shared cache first, installs needing the same packages fetch them once
+        WHEEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _run([*pip, "wheel", "-q", "-r", str(requirements), "-w", str(WHEEL_CACHE_DIR),
+              "--find-links", str(WHEEL_CACHE_DIR)])
+        wheelhouse = WHEEL_CACHE_DIR
+    _run([*pip, "install", "-q", "--no-index", "--no-compile", "--find-links", str(wheelhouse),
+          "-r", str(requirements)])
+
+    # identical package files across installs share one inode in the object store
+    stats = ObjectStore().dedup(venv, Manifest.build(venv, BYTECODE_PATTERNS))
+    log(f"venv: {stats.summary()}")
+    precompile(venv, venv, BYTECODE_PATTERNS)
+    (venv / COMPLETE_MARKER).write_text("")
+
+
+def provision_venv(staging: Path, build: BuildConfig, project_root: Path, executable_name: str,
+                   log=print) -> Path | None:
+    """
+    Links staging to the venv for its requirements, building the venv if no complete one
+    exists for the hash of the requirements file, the interpreter and the names and sizes
+    of the files in the wheelhouse.
+    The requirements and a relative wheelhouse are looked up in project_root, the source
+    directory of a local install, since its excludes may keep them out of the install.
+    Installs without requirements get their link removed. Returns the venv or None.
+    """
+    link = staging / VENV_LINK
+    if build.requirements is None:
+        if os.path.lexists(link):
+            link.unlink()
+        return None
+
+    requirements = project_root / build.requirements
+    if not requirements.is_file():
+        raise VenvError(f"requirements file {build.requirements} not found in the project")
+    interpreter = shutil.which(build.python)
+    if interpreter is None:
+        raise VenvError(f"python interpreter {build.python} not found")
+    wheelhouse = None
+    if build.wheelhouse is not None:
+        wheelhouse = project_root / build.wheelhouse
+        if not wheelhouse.is_dir():
+            raise VenvError(f"wheelhouse {wheelhouse} not found")
+
+    digest = _requirements_hash(requirements, interpreter, wheelhouse)
+    venv = VENV_DIR / executable_name / digest[:16]
+    if (venv / COMPLETE_MARKER).exists():
+        log("venv: requirements unchanged, reusing the existing venv")
+    else:
+        with phase("venv"):
+            _build_venv(venv, interpreter, requirements, wheelhouse, log)
+
+    tmp_link = link.with_name(VENV_LINK + ".tmp")
+    if os.path.lexists(tmp_link):
+        tmp_link.unlink()
+    os.symlink(venv, tmp_link)
+    os.replace(tmp_link, link)
+    return venv
+
+
+def collect_venvs(executable_name: str, versions: list[Path]) -> None:
+    """
+    Deletes the venvs of an install none of its kept versions link to.
+    """
+    venvs = VENV_DIR / executable_name
+    if not venvs.is_dir():
+        return
+    used = {os.readlink(v / VENV_LINK) for v in versions if os.path.islink(v / VENV_LINK)}
+    for venv in venvs.iterdir():
+        if str(venv) not in used:
+            shutil.rmtree(venv, ignore_errors=True)
+    _remove_if_empty(venvs)
+
+
+def remove_venvs(executable_name: str) -> None:
+    shutil.rmtree(VENV_DIR / executable_name, ignore_errors=True)
+    _remove_if_empty(VENV_DIR / executable_name)
+
+
+def _remove_if_empty(venvs: Path) -> None:
+    for directory in (venvs, VENV_DIR):
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
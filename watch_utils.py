@@ -0,0 +1,351 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from build_config_utils import BuildConfig
+from constants import DEFAULT_INSTALL_ROOT, CONFIG_FILE, WATCH_DEBOUNCE, WATCH_POLL_INTERVAL
+from debug_utils import error
+from exclude_matcher import ExcludeMatcher
+from file_utils import sync_paths
+from install_versions import VersionedInstall
+from meta_data import MetaData
+from timing_utils import phase, for_install
+from update_utils import INTERNAL_PATTERNS, UPDATED, update_executable, record_update
+from update_utils import registered_names
+from update_utils import precompile_install, dedup_install, count_copied
+
+# from linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_ONLYDIR | IN_DONT_FOLLOW)
+# struct inotify_event without the name that follows it
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    """
+    Reports changed paths under the watched trees through inotify, called through ctypes.
+    inotify watches single directories, so every directory that isn't excluded gets a
+    watch and directories created or moved in later are added as their events come in.
+    """
+    name = "inotify"
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        # watch descriptor -> (key, directory relative to the tree's root)
+        self.watches: dict[int, tuple[str, str]] = {}
+        self.trees: dict[str, tuple[Path, ExcludeMatcher]] = {}
+
+    def add(self, key: str, root: Path, matcher: ExcludeMatcher) -> None:
+        self.trees[key] = (root, matcher)
+        self._watch_tree(key, "")
+
+    def _watch_tree(self, key: str, rel: str) -> None:
+        root, matcher = self.trees[key]
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            path = os.path.join(root, current) if current else str(root)
+            wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    # gone again already, its delete event is on the way
+                    continue
+                raise OSError(err, f"inotify_add_watch {path}: {os.strerror(err)}")
+            self.watches[wd] = (key, current)
+
+            prefix = f"{current}/" if current else ""
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        rel_path = prefix + entry.name
+                        if entry.is_dir(follow_symlinks=False) and not matcher.matches(rel_path, True):
+                            stack.append(rel_path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _unwatch_tree(self, key: str, rel: str) -> None:
+        # a directory moved away keeps its watches, which would report its old path
+        prefix = rel + "/"
+        for wd, (watch_key, watch_rel) in list(self.watches.items()):
+            if watch_key == key and (watch_rel == rel or watch_rel.startswith(prefix)):
+                self._rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read(self, timeout: float | None) -> list[tuple[str, str]]:
+        """
+        Waits up to timeout seconds, forever for None, returns (key, rel_path) pairs.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        changes = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # the kernel dropped events, every tree has to be looked at again
+                changes.extend((key, "") for key in self.trees)
+                continue
+            watch = self.watches.get(wd)
+            if watch is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if not name:
+                # events about the watched directory itself, its parent reports those too
+                continue
+
+            key, rel_dir = watch
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            changes.append((key, rel_path))
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    self._unwatch_tree(key, rel_path)
+                elif mask & (IN_CREATE | IN_MOVED_TO) and not self.trees[key][1].excludes(rel_path, True):
+                    self._watch_tree(key, rel_path)
+        return changes
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Finds changed paths by rescanning the watched trees every interval seconds and
+    comparing their stat results, for filesystems inotify doesn't see changes on,
+    like network mounts.
+    """
+    name = "polling"
+
+    def __init__(self, interval: float = WATCH_POLL_INTERVAL):
+        self.interval = interval
+        self.trees: dict[str, tuple[Path, ExcludeMatcher, dict[str, tuple]]] = {}
+        self._next_scan = time.monotonic() + interval
+
+    def add(self, key: str, root: Path, matcher: ExcludeMatcher) -> None:
+        self.trees[key] = (root, matcher, self._scan(root, matcher))
+
+    @staticmethod
+    def _scan(root: Path, matcher: ExcludeMatcher) -> dict[str, tuple]:
+        snapshot = {}
+        stack = [(str(root), "")]
+        while stack:
+            current, rel = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for entry in entries:
+                rel_path = rel + entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if matcher.matches(rel_path, is_dir):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if is_dir:
+                    snapshot[rel_path] = (st.st_mode,)
+                    stack.append((entry.path, rel_path + "/"))
+                else:
+                    snapshot[rel_path] = (st.st_mode, st.st_size, st.st_mtime_ns, st.st_ino)
+        return snapshot
+
+    def read(self, timeout: float | None) -> list[tuple[str, str]]:
+        wait = self._next_scan - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, wait))
+        self._next_scan = time.monotonic() + self.interval
+
+        changes = []
+        for key, (root, matcher, old) in self.trees.items():
+            new = self._scan(root, matcher)
+            self.trees[key] = (root, matcher, new)
+            changes.extend((key, rel_path) for rel_path in old.keys() - new.keys())
+            changes.extend((key, rel_path) for rel_path, st in new.items() if old.get(rel_path) != st)
+        return changes
+
+    def close(self) -> None:
+        pass
+
+
+@dataclass
+class WatchTarget:
+    name: str
+    source_dir: Path
+    exclude: ExcludeMatcher
+    build: BuildConfig
+    dirty: set[str] = field(default_factory=set)
+    last_event: float = 0.0
+
+
+def _target_for(name: str) -> WatchTarget | None:
+    try:
+        meta_data = MetaData.load(name)
+    except (OSError, ValueError) as e:
+        print(f"{name}: couldn't read its metadata, not watching it: {e}")
+        return None
+    if meta_data.is_git_install or meta_data.source_archive:
+        print(f"{name} wasn't installed from a local directory, not watching it")
+        return None
+    source_dir = meta_data.source_path
+    if source_dir is None or not (source_dir / CONFIG_FILE).exists():
+        print(f"{name}: couldn't find its source directory at {source_dir}, not watching it")
+        return None
+    build = BuildConfig(source_dir)
+    return WatchTarget(name, source_dir, build.get_local_exclude_matcher(*INTERNAL_PATTERNS), build)
+
+
+def _sync_target(target: WatchTarget, watcher) -> None:
+    """
+    Syncs the dirty paths of target into a new version staged from the active one
+    and activates it.
+    """
+    paths = sorted(target.dirty)
+    target.dirty = set()
+    if not target.source_dir.is_dir():
+        print(f"{target.name}: {target.source_dir} is gone, waiting for it to come back")
+        return
+
+    if CONFIG_FILE in paths or target.build.requirements in paths:
+        # new excludes can change any file and new requirements need a new venv,
+        # both take a full update
+        update_executable(target.name)
+        new_target = _target_for(target.name)
+        if new_target is not None:
+            target.exclude, target.build = new_target.exclude, new_target.build
+            watcher.add(target.name, target.source_dir, target.exclude)
+        return
+
+    start = time.monotonic()
+    install_dir = DEFAULT_INSTALL_ROOT / target.name
+    versioned = VersionedInstall(target.name)
+    with for_install(target.name):
+        meta_data = MetaData.load(target.name)
+        # the manifest is taken before copying, if the source changes mid sync
+        # the next --update sees a mismatch instead of missing the change
+        with phase("manifest"):
+            if ("" in paths or meta_data.manifest is None
+                    or meta_data.manifest.is_stale_for(target.exclude)):
+                meta_data.rebuild_manifest(target.source_dir, target.exclude)
+            else:
+                meta_data.manifest.update_paths(target.source_dir, paths, target.exclude)
+
+        # a new version like any update, readers never see a batch half applied
+        # and unchanged files stay hardlinked to the store
+        with phase("stage"):
+            staging = versioned.stage()
+        try:
+            with phase("sync"):
+                stats = sync_paths(target.source_dir, staging, paths, target.exclude)
+            count_copied(stats)
+            if not stats.files_copied and not stats.files_removed:
+                versioned.discard(staging)
+                return
+            meta_data.write(staging)
+            dedup_install(staging, meta_data, log=lambda line: None)
+            precompile_install(staging, target.build, target.exclude, install_dir,
+                               log=lambda line: None, paths=paths)
+        except BaseException:
+            versioned.discard(staging)
+            raise
+        with phase("activate"):
+            versioned.activate(staging)
+
+    summary = stats.summary()
+    print(f"{target.name}: {summary} ({(time.monotonic() - start) * 1000:.0f} ms)", flush=True)
+    record_update(target.name, UPDATED, f"watch: {summary}")
+
+
+def watch(target_name: str, debounce: float = WATCH_DEBOUNCE, poll: bool = False) -> None:
+    """
+    Watches the source directories of target_name, or of every local install for all,
+    and syncs the paths that changed into the installs once a source has been quiet for
+    debounce seconds. Runs until interrupted.
+    """
+    names = registered_names() if target_name == "all" else [target_name]
+    if target_name != "all" and not (DEFAULT_INSTALL_ROOT / target_name).exists():
+        error(f"{target_name} is not installed")
+    targets = {t.name: t for t in map(_target_for, names) if t is not None}
+    if not targets:
+        error("nothing to watch")
+
+    watcher = None
+    if not poll:
+        try:
+            watcher = InotifyWatcher()
+            for target in targets.values():
+                watcher.add(target.name, target.source_dir, target.exclude)
+        except OSError as e:
+            print(f"inotify unavailable ({e}), polling every {WATCH_POLL_INTERVAL}s instead")
+            if watcher is not None:
+                watcher.close()
+            watcher = None
+    if watcher is None:
+        watcher = PollingWatcher()
+        for target in targets.values():
+            watcher.add(target.name, target.source_dir, target.exclude)
+
+    print(f"watching {', '.join(sorted(targets))} with {watcher.name}, ctrl-c to stop", flush=True)
+    try:
+        while True:
+            waits = [t.last_event + debounce - time.monotonic() for t in targets.values() if t.dirty]
+            for key, rel_path in watcher.read(max(0.0, min(waits)) if waits else None):
+                target = targets[key]
+                # the real type is checked when syncing, a file check never excludes too much
+                if not target.exclude.excludes(rel_path):
+                    target.dirty.add(rel_path)
+                    target.last_event = time.monotonic()
+
+            now = time.monotonic()
+            for target in targets.values():
+                if target.dirty and now - target.last_event >= debounce:
+                    _sync_target(target, watcher)
+    except KeyboardInterrupt:
+        print("stopped watching")
+    finally:
+        watcher.close()
@@ -0,0 +1,166 @@
+import os
+import re
+import shlex
+import shutil
+import stat
+from pathlib import Path
+from constants import SHABANG, WRAPPER_SHELL, WRAPPER_EXEC, WRAPPER_DIRECT
+
+WRAPPER_PERMISSIONS = (
+    stat.S_IRUSR
+    | stat.S_IWUSR
+    | stat.S_IXUSR
+    | stat.S_IRGRP
+    | stat.S_IXGRP
+    | stat.S_IROTH
+    | stat.S_IXOTH
+)
+
+PROJECT_DIR_VARIABLES = ("${dumb_project_dir}", "$dumb_project_dir")
+_PLAIN_WORD = re.compile(r"[\w.+-]+")
+_PYTHON = re.compile(r"(python|pypy)[\d.]*")
+# a command chaining several commands can't be exec'd as a whole
+_SHELL_OPERATORS = re.compile(r"[;&|\n]")
+# neither can one starting with variable assignments, exec would take A=1 as the program
+_ASSIGNMENT = re.compile(r"\s*[A-Za-z_]\w*=")
+
+
+def _resolve_interpreter(command: str) -> str:
+    """
+    Replaces a bare program name at the start of command with its absolute path,
+    so the wrapper doesn't search PATH on every run.
+    """
+    first, sep, rest = command.strip().partition(" ")
+    if not _PLAIN_WORD.fullmatch(first):
+        return command
+    resolved = shutil.which(first)
+    if resolved is None:
+        return command
+    return f"{resolved}{sep}{rest}"
+
+
+def _expand_project_dir(token: str, project_dir: Path) -> str:
+    for variable in PROJECT_DIR_VARIABLES:
+        token = token.replace(variable, str(project_dir))
+    return token
+
+
+def _split_interpreter_and_script(command: str, project_dir: Path) -> tuple[str, Path] | None:
+    """
+    Returns (interpreter, script) when command is just an interpreter and a script
+    inside the project, None for anything more complex.
+    """
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        return None
+    if len(tokens) != 2 or "$" in tokens[0] or _ASSIGNMENT.match(tokens[0]):
+        return None
+
+    script = _expand_project_dir(tokens[1], project_dir)
+    if "$" in script or not script.startswith(str(project_dir)):
+        return None
+    return tokens[0], Path(script)
+
+
+def _use_venv(command: str, venv: Path) -> str:
+    """
+    Points a command starting with a python interpreter at the venv's python.
+    """
+    first, sep, rest = command.strip().partition(" ")
+    if not _PYTHON.fullmatch(Path(first).name):
+        return command
+    return f"{venv / 'bin' / 'python'}{sep}{rest}"
+
+
+def _has_shebang(path: Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            return f.read(2) == b"#!"
+    except OSError:
+        return False
+
+
+def _shell_script(command: str, project_dir: Path) -> str:
+    return f'{SHABANG}\ndumb_project_dir={project_dir}\n{command} "$@"'
+
+
+def _exec_script(command: str, project_dir: Path) -> str:
+    # no env lookup and the shell is replaced by the command instead of waiting on it
+    sh = shutil.which("sh") or "/bin/sh"
+    return f'#!{sh}\ndumb_project_dir={project_dir}\nexec {_resolve_interpreter(command)} "$@"'
+
+
+def _python_script(interpreter: str, script: Path) -> str:
+    # runs the script in the wrapper's own interpreter, no shell at all.
+    # compile + exec rather than runpy, importing runpy costs more than the shell it replaces
+    return (
+        f"#!{interpreter}\n"
+        "import sys\n"
+        f"sys.argv[0] = __file__ = {str(script)!r}\n"
+        f"sys.path[0] = {str(script.parent)!r}\n"
+        "with open(__file__, 'rb') as f:\n"
+        "    code = compile(f.read(), __file__, 'exec')\n"
+        "del f\n"
+        "exec(code)\n"
+    )
+
+
+def _write_executable(wrapper_path: Path, script: str) -> None:
+    # replace instead of writing in place, the old wrapper may be a symlink into the install
+    tmp_path = wrapper_path.with_name(f".{wrapper_path.name}.dumb_tmp")
+    tmp_path.unlink(missing_ok=True)
+    tmp_path.write_text(script)
+    tmp_path.chmod(WRAPPER_PERMISSIONS)
+    os.replace(tmp_path, wrapper_path)
+
+
+def _symlink(wrapper_path: Path, target: Path) -> None:
+    tmp_path = wrapper_path.with_name(f".{wrapper_path.name}.dumb_tmp")
+    tmp_path.unlink(missing_ok=True)
+    os.symlink(target, tmp_path)
+    os.replace(tmp_path, wrapper_path)
+
+
+def write_wrapper(executable_name: str, command: str, project_dir: Path, bin_dir: Path,
+                  mode: str = WRAPPER_SHELL, venv: Path = None) -> str:
+    """
+    Writes the executable for an install to bin_dir, returns how it was done.
+
+    * shell: a sh script that runs the command as a child, the original behavior
+    * exec: a sh script with the interpreter resolved at install time that execs the command
+    * direct: for an interpreter plus a script, a symlink to the script when it has its own
+      shebang and is executable, or a python launcher with the interpreter as its shebang.
+      Anything else falls back to exec.
+
+    exec falls back to shell for commands chaining several commands or starting with
+    variable assignments.
+    With venv, the install's venv link, a command starting with python runs the venv's python.
+    """
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    wrapper_path = bin_dir / executable_name
+    if venv is not None:
+        command = _use_venv(command, venv)
+
+    if mode == WRAPPER_DIRECT:
+        split = _split_interpreter_and_script(command, project_dir)
+        if split is not None:
+            interpreter, script = split
+            # a script's own shebang would bypass the venv
+            if venv is None and _has_shebang(script) and os.access(script, os.X_OK):
+                _symlink(wrapper_path, script)
+                return "direct (symlink)"
+
+            resolved = shutil.which(interpreter)
+            if resolved and _PYTHON.fullmatch(Path(interpreter).name):
+                _write_executable(wrapper_path, _python_script(resolved, script))
+                return "direct (python launcher)"
+        mode = WRAPPER_EXEC
+
+    if (mode == WRAPPER_EXEC and not _SHELL_OPERATORS.search(command)
+            and not _ASSIGNMENT.match(command)):
+        _write_executable(wrapper_path, _exec_script(command, project_dir))
+        return WRAPPER_EXEC
+
+    _write_executable(wrapper_path, _shell_script(command, project_dir))
+    return WRAPPER_SHELL